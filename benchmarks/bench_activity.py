@@ -0,0 +1,99 @@
+"""Memory / tick-cost / presence-storm benchmark for activity tracking at 100k users
+
+Run: python benchmarks/bench_activity.py [users]
+"""
+import gc
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from bot import ActivityTracker  # noqa: E402
+
+class FakeMember:
+    """Stand-in for the discord.Member the old dicts kept alive (far smaller than a real one)"""
+    __slots__ = ('id', 'display_name')
+    
+    def __init__(self, user_id, display_name):
+        self.id = user_id
+        self.display_name = display_name
+
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - started
+    used = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    return result, used, elapsed
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    names = [(100000000000000000 + i, f'User{i}') for i in range(users)]
+    
+    # Spread last-seen over 2 hours: ~14% active, ~50% expired
+    now = datetime.now()
+    mono_now = time.monotonic()
+    ages = [(i * 7200 / users) for i in range(users)]
+    
+    def build_legacy():
+        activity = {}
+        for (user_id, username), age in zip(names, ages):
+            activity[str(user_id)] = {
+                'username': username,
+                'last_seen': now - timedelta(seconds=age),
+                'user_obj': FakeMember(user_id, username)
+            }
+        return activity
+    
+    def build_tracker():
+        tracker = ActivityTracker()
+        for (user_id, username), age in zip(reversed(names), reversed(ages)):
+            tracker.touch(user_id, username, mono_now - age)
+        return tracker
+    
+    legacy, legacy_bytes, legacy_build = measure(build_legacy)
+    tracker, tracker_bytes, tracker_build = measure(build_tracker)
+    
+    print(f"{users:,} tracked users")
+    print(f"  legacy dicts:  {legacy_bytes / 1e6:7.1f} MB ({legacy_bytes / users:.0f} B/user), build {legacy_build:.2f}s")
+    print(f"  tracker:       {tracker_bytes / 1e6:7.1f} MB ({tracker_bytes / users:.0f} B/user), build {tracker_build:.2f}s")
+    
+    # One presence tick: find active (<17 min), drop idle (>1 h)
+    started = time.perf_counter()
+    active = []
+    for user_id, activity in list(legacy.items()):
+        since = (now - activity['last_seen']).total_seconds()
+        if since < 1020:
+            active.append((user_id, activity['username']))
+        elif since > 3600:
+            del legacy[user_id]
+    legacy_tick = time.perf_counter() - started
+    
+    started = time.perf_counter()
+    tracker.expire(3600, mono_now)
+    tracker_active = [(r.user_id, r.username) for r in tracker.active_since(1020, mono_now)]
+    tracker_tick = time.perf_counter() - started
+    
+    print(f"  tick: legacy {legacy_tick * 1000:.1f} ms ({len(active)} active), "
+          f"tracker {tracker_tick * 1000:.1f} ms ({len(tracker_active)} active)")
+    print(f"  remaining: legacy {len(legacy)}, tracker {len(tracker)}")
+    
+    # Presence storm: every remaining user flips status 5 times in a row
+    storm = ActivityTracker()
+    members = [FakeMember(user_id, username) for user_id, username in names[:50_000]]
+    started = time.perf_counter()
+    for _ in range(5):
+        for member in members:
+            storm.record_presence(member.id, member.display_name)
+    elapsed = time.perf_counter() - started
+    print(f"  storm: {storm.presence_events:,} events in {elapsed:.2f}s "
+          f"({storm.presence_events / elapsed:,.0f}/s), {storm.presence_dropped:,} coalesced")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Demonstrate backend load shedding and circuit breaking against the fake backend
+
+Run: python benchmarks/bench_backpressure.py
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+PORT = 8766
+os.environ.setdefault('PHP_API_URL', f'http://127.0.0.1:{PORT}/discord.php')
+os.environ.setdefault('API_MAX_CONCURRENCY', '20')
+os.environ.setdefault('API_MAX_QUEUE', '60')
+os.environ.setdefault('API_BREAKER_THRESHOLD', '5')
+os.environ.setdefault('API_BREAKER_COOLDOWN', '2')
+
+import bot  # noqa: E402
+from fake_backend import FakeBackend  # noqa: E402
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+async def timed(kind, data):
+    started = time.perf_counter()
+    try:
+        status, _ = await bot.api_client.request(kind, data)
+        outcome = 'ok' if status == 200 else f'http {status}'
+    except bot.BackendOverloaded:
+        outcome = 'shed'
+    except Exception as e:
+        outcome = type(e).__name__
+    return outcome, time.perf_counter() - started
+
+def summarize(label, results):
+    outcomes = {}
+    for outcome, _ in results:
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+    latencies = [elapsed for outcome, elapsed in results if outcome == 'ok']
+    print(f"  {label:<12} {outcomes}  p50 {percentile(latencies, 0.5):.2f}s  p99 {percentile(latencies, 0.99):.2f}s")
+
+async def slow_backend(backend):
+    print("\n1) Slow backend (1s per call): 300 background XP calls + 30 commands")
+    backend.latency, backend.error_rate = 1.0, 0.0
+
+    background = [
+        asyncio.create_task(timed('xp', {'action': 'presence_xp', 'user_id': str(i), 'username': 'u'}))
+        for i in range(300)
+    ]
+    interactive = []
+    for i in range(30):
+        interactive.append(asyncio.create_task(timed('command', {'command': '!status', 'user_id': str(i), 'username': 'u'})))
+        await asyncio.sleep(0.05)
+
+    summarize('background', await asyncio.gather(*background))
+    summarize('interactive', await asyncio.gather(*interactive))
+    print(f"  client: {bot.api_client.stats()}  backend max in flight: {backend.max_in_flight}")
+
+async def failing_backend(backend):
+    print("\n2) Failing backend (HTTP 500): 50 background calls, one at a time")
+    backend.latency, backend.error_rate = 0.01, 1.0
+    calls_before = backend.total_calls
+
+    results = [await timed('xp', {'action': 'presence_xp', 'user_id': str(i), 'username': 'u'}) for i in range(50)]
+    summarize('background', results)
+    print(f"  reached backend: {backend.total_calls - calls_before}, breaker: {bot.api_client.breaker.state}")
+
+    interactive = await timed('command', {'command': '!status', 'user_id': '1', 'username': 'u'})
+    print(f"  interactive while open: {interactive[0]} (still attempted)")
+
+async def recovered_backend(backend):
+    print("\n3) Backend recovers")
+    backend.latency, backend.error_rate = 0.01, 0.0
+    await asyncio.sleep(bot.api_client.breaker.cooldown)
+    print(f"  after cooldown breaker: {bot.api_client.breaker.state}")
+
+    outcome, _ = await timed('xp', {'action': 'presence_xp', 'user_id': '1', 'username': 'u'})
+    print(f"  probe: {outcome}, breaker: {bot.api_client.breaker.state}")
+
+async def main():
+    backend = FakeBackend()
+    await backend.start(port=PORT)
+    try:
+        await slow_backend(backend)
+        await failing_backend(backend)
+        await recovered_backend(backend)
+        print(f"\nShed totals: {bot.api_client.stats()['shed']}")
+    finally:
+        await bot.api_client.close()
+        await backend.stop()
+
+if __name__ == "__main__":
+    asyncio.run(main())
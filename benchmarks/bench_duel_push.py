@@ -0,0 +1,115 @@
+"""Exercise the duel event listener against the fake backend
+
+Creates duel channels in a fake guild, then has the backend push expiries,
+a duel_ended event and an unsigned request, and finally shows the polling
+fallback when the listener is down.
+
+Run: python benchmarks/bench_duel_push.py --duels 20
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+BACKEND_PORT = 8769
+EVENTS_PORT = 8770
+SECRET = 'bench-secret'
+os.environ.setdefault('PHP_API_URL', f'http://127.0.0.1:{BACKEND_PORT}/discord.php')
+os.environ.setdefault('DUEL_DB_PATH', os.path.join(tempfile.mkdtemp(), 'duels.db'))
+os.environ.setdefault('DUEL_EVENTS_PORT', str(EVENTS_PORT))
+os.environ.setdefault('DUEL_EVENTS_SECRET', SECRET)
+
+import aiohttp  # noqa: E402
+
+import bot  # noqa: E402
+from fake_backend import FakeBackend  # noqa: E402
+from load_test import FakeGuild, FakeMessage  # noqa: E402
+
+async def create_duels(guild, count):
+    lobby = guild.channels[list(guild.channels)[0]]
+    names = []
+    for index in range(count):
+        player1, player2 = guild.members[2 * index], guild.members[2 * index + 1]
+        before = set(guild.channels)
+        await bot.handle_duel_command(FakeMessage(player1, lobby, f'!duel challenge <@{player2.id}>'))
+        names.extend(guild.channels[channel_id].name for channel_id in set(guild.channels) - before)
+    return names
+
+async def wait_deleted(guild, names, timeout=5):
+    started = time.perf_counter()
+    while any(channel.name in names for channel in guild.channels.values()):
+        if time.perf_counter() - started > timeout:
+            break
+        await asyncio.sleep(0.001)
+    return time.perf_counter() - started
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--duels', type=int, default=20)
+    args = parser.parse_args()
+
+    guild = FakeGuild(1, args.duels * 2)
+    bot.bot.get_guild = {guild.id: guild}.get
+    bot.bot.get_channel = guild.get_channel
+    bot.bot.is_ready = lambda: True
+    bot.bot.wait_until_ready = lambda: asyncio.sleep(0)
+
+    push_url = f'http://127.0.0.1:{EVENTS_PORT}/duel-events'
+    backend = FakeBackend(push_url=push_url, push_secret=SECRET)
+    await backend.start(port=BACKEND_PORT)
+    await bot.duel_event_server.start('127.0.0.1', EVENTS_PORT)
+
+    try:
+        names = await create_duels(guild, args.duels)
+        print(f"⚔️ {len(names)} duel channels")
+
+        half = len(names) // 2
+        started = time.perf_counter()
+        await backend.expire(names[:half])
+        elapsed = time.perf_counter() - started + await wait_deleted(guild, names[:half])
+        print(f"\n1) push channels_to_delete for {half} duels: deleted in {elapsed * 1000:.1f} ms "
+              f"(polling: up to 300 s)")
+
+        remaining = [channel_id for channel_id in bot.duel_channels if guild.get_channel(channel_id)]
+        duel_id = bot.duel_channels[remaining[0]]['duel_id']
+        status = await backend.push({'event': 'duel_ended', 'duel_id': duel_id, 'delete_delay': 600,
+                                     'message': '⌛ Turn timeout, duel over'})
+        armed = remaining[0] in bot.deletion_scheduler
+        print(f"2) push duel_ended for duel {duel_id}: HTTP {status}, deletion armed: {armed}")
+
+        async with aiohttp.ClientSession() as session:
+            async with session.post(push_url, json={'channels_to_delete': names[half:]}) as response:
+                unsigned = response.status
+            async with session.post(push_url, json={'channels_to_delete': names[half:]},
+                                    headers={'X-Tesseade-Timestamp': str(int(time.time())),
+                                             'X-Tesseade-Signature': 'sha256=' + '0' * 64}) as response:
+                forged = response.status
+        survivors = sum(channel.name in names[half:] for channel in guild.channels.values())
+        print(f"3) unsigned push: HTTP {unsigned}, forged signature: HTTP {forged}, "
+              f"{survivors} channels untouched")
+
+        await bot.duel_event_server.stop()
+        await backend.expire(names[half:])
+        print(f"4) listener down: {len(backend.channels_to_delete)} channels queued for polling")
+        await bot.cleanup_duel_channels()
+        await wait_deleted(guild, names[half:])
+        survivors = sum(channel.name in names[half:] for channel in guild.channels.values())
+        print(f"   after one fallback poll: {survivors} left")
+
+        print(f"\npushes: {dict(backend.pushes)}; listener handled {bot.duel_event_server.handled}, "
+              f"rejected {bot.duel_event_server.rejected}")
+        print(f"cleanup polls per hour: 12 without the listener, "
+              f"{3600 / bot.DUEL_CLEANUP_FALLBACK_INTERVAL:g} with it")
+    finally:
+        await bot.deletion_scheduler.stop()
+        await bot.duel_event_server.stop()
+        await bot.api_client.close()
+        await backend.stop()
+
+if __name__ == "__main__":
+    asyncio.run(main())
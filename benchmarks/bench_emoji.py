@@ -0,0 +1,75 @@
+"""Micro-benchmark: clean_all_emojis vs the old list-scan implementation
+
+Run: python benchmarks/bench_emoji.py
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from bot import clean_all_emojis  # noqa: E402
+
+def legacy_clean_all_emojis(text):
+    """Previous implementation, kept here for comparison"""
+    all_emojis = [
+        # Factions
+        '🌸', '⚡', '🌊', '🔥', '🌿', '❄️', '🌙', '☀️', '⭐', '💎',
+        '🗡️', '🛡️', '🏹', '⚔️', '🔮', '📜', '🧙', '🐉', '🦅', '🐺',
+        '🏰', '⚖️', '🎭', '🌺', '🍃', '💫', '🔱', '👑', '🌟', '💀',
+        '👹', '🎃', '🌋', '🌪️', '⛈️', '🌈', '🦋', '🕷️', '🐍',
+        # Races
+        '👤', '🧝', '🧔', '👺', '😈', '🧚', '🦸', '🧛', '🧞', '👽',
+        '🤖', '💀', '🐺', '🦅', '🐲', '🐯', '🦁', '🐻', '🦊', '🐱',
+        # Specializations
+        '⚔️', '🔮', '🏹', '🤝', '🗡️', '🛡️', '🔨', '🪓', '🏺', '📿',
+        '💊', '🎯', '🎪', '🎨', '🎭', '🎵', '📚', '🔬', '⚗️', '🔧'
+    ]
+    
+    cleaned = text.strip()
+    
+    while cleaned and any(cleaned.startswith(emoji) for emoji in all_emojis):
+        for emoji in all_emojis:
+            if cleaned.startswith(emoji):
+                cleaned = cleaned[len(emoji):].strip()
+                break
+    
+    return cleaned if cleaned else text
+
+DISPLAY_NAMES = [
+    'Marco',
+    'xX_Shadow_Xx',
+    '🌸🧝🔮 Aria',
+    '🔥 🐉 ⚔️ Drakon',
+    '🌊🧚🎵 Sirena',
+    '💀👺🗡️ Grimm',
+    '⚖️🦁🛡️  Leone',
+    '🌙 Luna 🌙',
+    '🐺🐺🐺 Lupo',
+    '❄️🧛📚 Vlad',
+    '👑🤖🔧 Robo_King',
+    'Giulia ✨',
+]
+
+def main():
+    rounds = 20000
+    print(f"{'name':<22} {'legacy µs':>10} {'compiled µs':>12} {'speedup':>8}")
+    for name in DISPLAY_NAMES:
+        legacy = timeit.timeit(lambda: legacy_clean_all_emojis(name), number=rounds) / rounds * 1e6
+        compiled = timeit.timeit(lambda: clean_all_emojis(name), number=rounds) / rounds * 1e6
+        print(f"{name!r:<22} {legacy:>10.2f} {compiled:>12.2f} {legacy / compiled:>7.1f}x")
+    
+    legacy_total = timeit.timeit(lambda: [legacy_clean_all_emojis(n) for n in DISPLAY_NAMES], number=rounds // 10)
+    compiled_total = timeit.timeit(lambda: [clean_all_emojis(n) for n in DISPLAY_NAMES], number=rounds // 10)
+    print(f"\nAll names: legacy {legacy_total:.3f}s, compiled {compiled_total:.3f}s ({legacy_total / compiled_total:.1f}x)")
+    
+    # Names the old list never handled
+    for name in ['🧑‍🚀 Astro', '👍🏽 Pollice', '️ Ghost', '🇮🇹 Italo', '1️⃣ Uno']:
+        print(f"{name!r}: legacy={legacy_clean_all_emojis(name)!r} compiled={clean_all_emojis(name)!r}")
+    
+    # Symbols that aren't emoji stay
+    for name in ['★Star', '♠Ace', '⌘Cmd', '✓ Done']:
+        print(f"{name!r}: legacy={legacy_clean_all_emojis(name)!r} compiled={clean_all_emojis(name)!r}")
+
+if __name__ == "__main__":
+    main()
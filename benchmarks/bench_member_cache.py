@@ -0,0 +1,140 @@
+"""Compare MEMBER_CACHE_POLICY startup cost: cached members, parse time and RSS
+
+Feeds synthetic GUILD_CREATE and GUILD_MEMBERS_CHUNK payloads through
+discord.py's connection state, one child process per policy so RSS numbers
+don't mix. "full" receives every member in chunks before on_ready, "lazy"
+and "minimal" only get what GUILD_CREATE carries.
+
+Run: python benchmarks/bench_member_cache.py --guilds 5 --members 50000 --online 0.1
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+CHUNK_SIZE = 1000  # members per GUILD_MEMBERS_CHUNK, as sent by Discord
+
+def rss_mb() -> float:
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def member_payload(member_id):
+    return {
+        'user': {'id': str(member_id), 'username': f'user{member_id}', 'discriminator': '0',
+                 'avatar': None, 'global_name': None},
+        'roles': [],
+        'joined_at': '2024-01-01T00:00:00+00:00',
+        'nick': None,
+        'deaf': False,
+        'mute': False,
+        'flags': 0,
+    }
+
+def presence_payload(member_id, guild_id):
+    return {'user': {'id': str(member_id)}, 'status': 'online', 'activities': [],
+            'client_status': {'desktop': 'online'}, 'guild_id': str(guild_id)}
+
+def guild_payload(guild_id, members, online, presences):
+    online_ids = range(guild_id * 10_000_000, guild_id * 10_000_000 + int(members * online))
+    return {
+        'id': str(guild_id),
+        'name': f'guild{guild_id}',
+        'icon': None,
+        'owner_id': '1',
+        'member_count': members,
+        'large': True,
+        'roles': [{'id': str(guild_id), 'name': '@everyone', 'permissions': '0', 'position': 0,
+                   'color': 0, 'hoist': False, 'managed': False, 'mentionable': False}],
+        'channels': [{'id': str(guild_id * 100 + i), 'type': 0, 'name': f'chan{i}', 'position': i,
+                      'permission_overwrites': []} for i in range(20)],
+        'emojis': [],
+        'stickers': [],
+        'features': [],
+        'voice_states': [],
+        'threads': [],
+        # Large guilds only ship online members, and none without the presences intent
+        'members': [member_payload(member_id) for member_id in online_ids] if presences else [],
+        'presences': [presence_payload(member_id, guild_id) for member_id in online_ids] if presences else [],
+    }
+
+def chunk_payloads(guild_id, members, nonce):
+    chunk_count = (members + CHUNK_SIZE - 1) // CHUNK_SIZE
+    first = guild_id * 10_000_000
+    for index in range(chunk_count):
+        ids = range(first + index * CHUNK_SIZE, first + min(members, (index + 1) * CHUNK_SIZE))
+        yield {'guild_id': str(guild_id), 'members': [member_payload(member_id) for member_id in ids],
+               'chunk_index': index, 'chunk_count': chunk_count, 'nonce': nonce}
+
+async def child(args):
+    import bot
+    from discord.state import ChunkRequest
+
+    state = bot.bot._connection
+    presences = bot.intents.presences
+    baseline = rss_mb()
+    payloads = received = 0
+
+    started = time.perf_counter()
+    for guild_id in range(1, args.guilds + 1):
+        raw = json.dumps(guild_payload(guild_id, args.members, args.online, presences))
+        received += len(raw)
+        payloads += 1
+        state.parse_guild_create(json.loads(raw))
+
+        if state._guild_needs_chunking(state._get_guild(guild_id)):
+            request = ChunkRequest(guild_id, asyncio.get_running_loop(), state._get_guild,
+                                   cache=state.member_cache_flags.joined)
+            state._chunk_requests[request.nonce] = request
+            for chunk in chunk_payloads(guild_id, args.members, request.nonce):
+                raw = json.dumps(chunk)
+                received += len(raw)
+                payloads += 1
+                state.parse_guild_members_chunk(json.loads(raw))
+    elapsed = time.perf_counter() - started
+
+    gc.collect()
+    cached = sum(len(guild.members) for guild in state.guilds)
+    print(json.dumps({'payloads': payloads, 'received_mb': received / 2 ** 20, 'parse_s': elapsed,
+                      'cached': cached, 'rss_mb': rss_mb() - baseline}))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--guilds', type=int, default=5)
+    parser.add_argument('--members', type=int, default=50000, help='members per guild')
+    parser.add_argument('--online', type=float, default=0.1, help='share of members online at login')
+    parser.add_argument('--policies', default='full,lazy,minimal')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        asyncio.run(child(args))
+        return
+
+    print(f"👥 {args.guilds} guilds x {args.members} members, {args.online:.0%} online at login\n")
+    print(f"{'policy':<9}{'payloads':>9}{'MB in':>8}{'parse':>9}{'cached':>10}{'RSS':>10}")
+    for policy in args.policies.split(','):
+        env = dict(os.environ, MEMBER_CACHE_POLICY=policy, DUEL_DB_PATH=os.path.join(tempfile.mkdtemp(), 'duels.db'))
+        output = subprocess.run(
+            [sys.executable, __file__, '--child', '--guilds', str(args.guilds), '--members', str(args.members),
+             '--online', str(args.online)],
+            env=env, capture_output=True, text=True, check=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{policy:<9}{result['payloads']:>9}{result['received_mb']:>8.1f}{result['parse_s']:>8.2f}s"
+              f"{result['cached']:>10}{result['rss_mb']:>7.0f} MB")
+
+    print("\npayloads/MB in: gateway traffic before on_ready (full waits for every chunk)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Interactive vs background latency with and without priority lanes
+
+A steady background load (presence/message XP, cleanup polling) keeps the
+backend pool saturated while duel turns and game commands trickle in.
+
+Run: python benchmarks/bench_priority.py
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+PORT = 8767
+os.environ.setdefault('PHP_API_URL', f'http://127.0.0.1:{PORT}/discord.php')
+
+import bot  # noqa: E402
+from fake_backend import FakeBackend  # noqa: E402
+
+CONCURRENCY = 20
+DURATION = 5.0
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+async def run(client, label):
+    latencies = {'duel': [], 'command': [], 'xp': []}
+    stop = time.perf_counter() + DURATION
+
+    async def call(kind, data):
+        started = time.perf_counter()
+        try:
+            await client.request(kind, data)
+        except bot.BackendOverloaded:
+            return
+        latencies[kind].append(time.perf_counter() - started)
+
+    async def background_worker(worker):
+        while time.perf_counter() < stop:
+            await call('xp', {'action': 'presence_xp', 'user_id': str(worker), 'username': 'u'})
+
+    async def interactive(kind, command, interval):
+        tasks = []
+        while time.perf_counter() < stop:
+            tasks.append(asyncio.create_task(call(kind, {'command': command, 'user_id': '1', 'username': 'u'})))
+            await asyncio.sleep(interval)
+        await asyncio.gather(*tasks)
+
+    await asyncio.gather(
+        *(background_worker(i) for i in range(60)),
+        interactive('duel', '!duel attack physical', 0.1),
+        interactive('command', '!status', 0.05),
+    )
+
+    print(f"\n{label}")
+    for kind, values in latencies.items():
+        print(f"  {kind:<8} {len(values):>5} calls  p50 {percentile(values, 0.5) * 1000:6.0f} ms"
+              f"  p99 {percentile(values, 0.99) * 1000:6.0f} ms")
+
+async def check_cancelled_waiter():
+    """A waiter cancelled and then skipped by release() must still raise CancelledError"""
+    limiter = bot.PriorityLimiter(1, {})
+    await limiter.acquire('background')
+    waiter = asyncio.create_task(limiter.acquire('background'))
+    await asyncio.sleep(0)
+    waiter.cancel()
+    limiter.release('background')  # pops the cancelled future before the task resumes
+    try:
+        await waiter
+    except asyncio.CancelledError:
+        pass
+    assert limiter.in_use == 0 and not limiter.waiters['background'], "limiter leaked a slot"
+    print("cancelled waiter: CancelledError, no slot leaked")
+
+async def main():
+    await check_cancelled_waiter()
+
+    backend = FakeBackend(latency=0.05)
+    await backend.start(port=PORT)
+    try:
+        # Baseline: every kind in one lane, i.e. a plain FIFO semaphore
+        lanes_by_kind = bot.API_LANES
+        bot.API_LANES = dict.fromkeys(lanes_by_kind, 'background')
+        fifo = bot.BackendClient(CONCURRENCY, max_queue=1000, background_share=1.0)
+        await run(fifo, "Single FIFO queue")
+        await fifo.close()
+        bot.API_LANES = lanes_by_kind
+
+        lanes = bot.BackendClient(CONCURRENCY, max_queue=1000, background_share=1.0, lane_limits={
+            'interactive': CONCURRENCY - 2,
+            'background': CONCURRENCY * 3 // 5,
+        })
+        await run(lanes, "Priority lanes (interactive 18, background 12 of 20 slots)")
+        await lanes.close()
+    finally:
+        await backend.stop()
+
+if __name__ == "__main__":
+    asyncio.run(main())
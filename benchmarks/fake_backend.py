@@ -0,0 +1,231 @@
+"""Local stand-in for discord.php / xp-handler.php with configurable latency and errors
+
+Run standalone:  python benchmarks/fake_backend.py --port 8765 --latency 0.05 --error-rate 0.01
+then start the bot with PHP_API_URL=http://127.0.0.1:8765/discord.php
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import random
+import time
+from collections import Counter
+
+import aiohttp
+from aiohttp import web
+
+FACTION_EMOJIS = ['🌸', '⚡', '🌊', '🔥', '🌿']
+RACE_EMOJIS = ['🧝', '🧔', '👺', '🧛', '🤖']
+SPEC_EMOJIS = ['⚔️', '🔮', '🏹', '🛡️', '📚']
+
+class FakeBackend:
+    """aiohttp app answering like the PHP backend.
+
+    latency: mean seconds per request (+/- jitter fraction)
+    error_rate: share of requests answered with HTTP 500
+    level_up_rate: share of XP awards that report a level up
+    push_url / push_secret: bot duel event listener; expire() pushes there and
+    falls back to the !system cleanup_duels list when the push fails
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.2, error_rate: float = 0.0,
+                 level_up_rate: float = 0.05, bulk_presence: bool = True, bulk_message: bool = True, seed: int = 1,
+                 push_url: str = None, push_secret: str = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.level_up_rate = level_up_rate
+        self.bulk_presence = bulk_presence
+        self.bulk_message = bulk_message
+        self.random = random.Random(seed)
+        self.calls = Counter()  # action / command word: requests
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.channels_to_delete = []
+        self.push_url = push_url
+        self.push_secret = push_secret
+        self.pushes = Counter()  # HTTP status (or 'error'): pushes
+        self._duel_ids = 0
+        self._runner = None
+
+    @property
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+    async def start(self, host: str = '127.0.0.1', port: int = 8765) -> str:
+        """Start serving, returns the discord.php URL"""
+        app = web.Application()
+        app.router.add_post('/discord.php', self.handle_discord)
+        app.router.add_post('/xp-handler.php', self.handle_xp)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        return f'http://{host}:{port}/discord.php'
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def push(self, payload) -> int:
+        """POST a signed duel event to the bot, returns the HTTP status (0 if unreachable)"""
+        body = json.dumps(payload).encode()
+        timestamp = str(int(time.time()))
+        signature = hmac.new(self.push_secret.encode(), timestamp.encode() + b'.' + body, hashlib.sha256).hexdigest()
+        headers = {
+            'Content-Type': 'application/json',
+            'X-Tesseade-Timestamp': timestamp,
+            'X-Tesseade-Signature': f'sha256={signature}',
+        }
+        try:
+            async with aiohttp.ClientSession() as session:
+                async with session.post(self.push_url, data=body, headers=headers) as response:
+                    self.pushes[response.status] += 1
+                    return response.status
+        except aiohttp.ClientError:
+            self.pushes['error'] += 1
+            return 0
+
+    async def expire(self, channel_names):
+        """Duels ended: push their channels to the bot, or queue them for the next poll"""
+        if self.push_url and await self.push({'event': 'channels_to_delete', 'channels_to_delete': channel_names}) == 200:
+            return
+        self.channels_to_delete.extend(channel_names)
+
+    async def _simulate(self, label: str):
+        """Count the call, wait, maybe fail. Returns an error response or None"""
+        self.calls[label] += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.latency:
+                spread = self.latency * self.jitter
+                await asyncio.sleep(max(0.0, self.random.uniform(self.latency - spread, self.latency + spread)))
+        finally:
+            self.in_flight -= 1
+
+        if self.error_rate and self.random.random() < self.error_rate:
+            return web.Response(status=500, text='Internal Server Error')
+        return None
+
+    def _award(self, user_id, **extra):
+        result = {'user_id': user_id, 'success': True, 'xp_gained': 5, 'level_up': False}
+        if self.random.random() < self.level_up_rate:
+            result['level_up'] = True
+            result['message'] = f"reached level {self.random.randint(2, 50)}! 🎉"
+        result.update(extra)
+        return result
+
+    async def handle_discord(self, request):
+        data = await request.json()
+        command = data.get('command', '')
+        words = command.split()
+        label = ' '.join(words[:2]) if words[:1] in (['!duel'], ['!system']) else (words[0] if words else '')
+
+        error = await self._simulate(label)
+        if error:
+            return error
+
+        if command == '!system cleanup_duels':
+            expired, self.channels_to_delete = self.channels_to_delete, []
+            return web.json_response({'channels_to_delete': expired})
+
+        if label == '!duel challenge':
+            self._duel_ids += 1
+            opponent = ''.join(ch for ch in (words[2] if len(words) > 2 else '') if ch.isdigit())
+            return web.json_response({
+                'response': '⚔️ Challenge accepted!',
+                'create_duel_channel': True,
+                'channel_data': {
+                    'duel_id': self._duel_ids,
+                    'name': f'duel-{self._duel_ids}',
+                    'players': [data['user_id'], opponent or data['user_id']],
+                }
+            })
+
+        if label == '!duel attack':
+            finished = self.random.random() < 0.1
+            reply = {'response': f"💥 {data['username']} hits for {self.random.randint(5, 25)}"}
+            if finished:
+                reply['response'] += '\n🏆 Duel over!'
+                reply['schedule_channel_delete'] = True
+                reply['delete_delay'] = 600
+            return web.json_response(reply)
+
+        return web.json_response({'response': f"✅ {command}"})
+
+    async def handle_xp(self, request):
+        data = await request.json()
+        action = data.get('action', '')
+
+        if action == 'presence_xp_bulk' and not self.bulk_presence:
+            self.calls[action] += 1
+            return web.json_response({'success': False, 'error': 'Unknown action'})
+
+        error = await self._simulate(action)
+        if error:
+            return error
+
+        if action == 'message_xp' and 'users' not in data:
+            return web.json_response(self._award(data['user_id']))
+
+        if action == 'message_xp' and not self.bulk_message:
+            # Original backend: one user_id per message_xp call
+            return web.json_response({'success': False, 'error': 'Missing user_id'})
+
+        if action in ('message_xp', 'presence_xp_bulk'):
+            return web.json_response({
+                'success': True,
+                'results': [self._award(user['user_id']) for user in data.get('users', [])]
+            })
+
+        if action == 'presence_xp':
+            return web.json_response(self._award(data['user_id']))
+
+        if action == 'get_user_data':
+            user_id = str(data['user_id'])
+            index = int(user_id[-1]) if user_id[-1:].isdigit() else 0
+            return web.json_response({'user_data': {
+                'username': f'User{user_id[-4:]}',
+                'custom_nickname': None,
+                'faction_emoji': FACTION_EMOJIS[index % 5],
+                'faction_display_name': 'Faction',
+                'race_emoji': RACE_EMOJIS[index % 5],
+                'race_display_name': 'Race',
+                'spec_emoji': SPEC_EMOJIS[index % 5],
+                'spec_display_name': 'Spec',
+            }})
+
+        if action in ('leaderboard', 'get_stats', 'get_cooldowns'):
+            return web.json_response({'response': f"📊 {action}"})
+
+        return web.json_response({'success': False, 'error': f'Unknown action {action}'})
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--no-bulk-presence', action='store_true')
+    parser.add_argument('--no-bulk-message', action='store_true')
+    args = parser.parse_args()
+
+    backend = FakeBackend(latency=args.latency, error_rate=args.error_rate, bulk_presence=not args.no_bulk_presence,
+                           bulk_message=not args.no_bulk_message)
+    url = await backend.start(args.host, args.port)
+    print(f"🧪 Fake backend at {url} (latency {args.latency}s, errors {args.error_rate:.0%})")
+
+    try:
+        while True:
+            await asyncio.sleep(30)
+            print(f"🧪 {backend.total_calls} calls: {dict(backend.calls.most_common(8))}")
+    finally:
+        await backend.stop()
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
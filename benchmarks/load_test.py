@@ -0,0 +1,302 @@
+"""Load-test bot.py against the fake backend with synthetic Discord events
+
+Drives on_message, on_presence_update, run_presence_tick and the duel flow
+without a Discord connection and reports throughput, handler latency,
+event-loop lag and backend calls per message.
+
+Run: python benchmarks/load_test.py --users 2000 --messages 20000 --latency 0.05
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+PORT = 8768
+os.environ.setdefault('PHP_API_URL', f'http://127.0.0.1:{PORT}/discord.php')
+os.environ.setdefault('DUEL_DB_PATH', os.path.join(tempfile.mkdtemp(), 'duels.db'))
+
+import discord  # noqa: E402
+
+import bot  # noqa: E402
+from fake_backend import FakeBackend  # noqa: E402
+
+# --- Fake Discord objects: just what bot.py touches ---
+
+class FakePermissions:
+    manage_nicknames = True
+
+class FakeChannel:
+    def __init__(self, channel_id, name, guild, category=None):
+        self.id = channel_id
+        self.name = name
+        self.guild = guild
+        self.category = category
+        self.sent = 0
+        self.mention = f'<#{channel_id}>'
+
+    async def send(self, content=None, embed=None):
+        self.sent += 1
+
+    async def delete(self, reason=None):
+        self.guild.channels.pop(self.id, None)
+
+class FakeCategory:
+    def __init__(self, category_id, name):
+        self.id = category_id
+        self.name = name
+
+class FakeMember:
+    def __init__(self, member_id, name, guild):
+        self.id = member_id
+        self.name = name
+        self.display_name = name
+        self.nick = None
+        self.guild = guild
+        self.bot = False
+        self.status = discord.Status.online
+        self.guild_permissions = FakePermissions()
+        self.mention = f'<@{member_id}>'
+
+    def __str__(self):
+        return self.name
+
+    async def edit(self, nick=None):
+        self.nick = self.display_name = nick
+
+class FakeGuild:
+    def __init__(self, guild_id, users):
+        self.id = guild_id
+        self.owner_id = 0
+        self.unavailable = False
+        self.channels = {}
+        self.categories = []
+        self.default_role = object()
+        self.members = [FakeMember(guild_id * 1_000_000 + i, f'User{i}', self) for i in range(users)]
+        self._members = {member.id: member for member in self.members}
+        self.me = FakeMember(1, 'Tesseade', self)
+        self._next_id = guild_id * 1_000_000 + 900_000
+        for name in ('general', 'chat', 'game'):
+            self._add_channel(name)
+
+    def _add_channel(self, name, category=None):
+        self._next_id += 1
+        channel = FakeChannel(self._next_id, name, self, category)
+        self.channels[channel.id] = channel
+        return channel
+
+    @property
+    def text_channels(self):
+        return list(self.channels.values())
+
+    def get_member(self, member_id):
+        return self._members.get(member_id)
+
+    def get_channel(self, channel_id):
+        return self.channels.get(channel_id)
+
+    async def create_category(self, name):
+        self._next_id += 1
+        category = FakeCategory(self._next_id, name)
+        self.categories.append(category)
+        return category
+
+    async def create_text_channel(self, name, overwrites=None, category=None, topic=None):
+        return self._add_channel(name, category)
+
+class FakeMessage:
+    def __init__(self, author, channel, content):
+        self.author = author
+        self.channel = channel
+        self.guild = channel.guild
+        self.content = content
+
+class FakePresence:
+    def __init__(self, member):
+        self.id = member.id
+        self.display_name = member.display_name
+        self.guild = member.guild
+        self.status = discord.Status.online
+
+# --- Measurement helpers ---
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+def describe(values):
+    return (f"p50 {percentile(values, 0.5) * 1000:7.1f} ms  p95 {percentile(values, 0.95) * 1000:7.1f} ms  "
+            f"p99 {percentile(values, 0.99) * 1000:7.1f} ms  max {max(values, default=0) * 1000:7.1f} ms")
+
+class LoopLagMonitor:
+    """Measures how late a 10 ms sleep wakes up"""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.lags = []
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, loop.time() - started - self.interval))
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+def pick_content(rng):
+    roll = rng.random()
+    if roll < 0.85:
+        return 'hello there'
+    if roll < 0.93:
+        return rng.choice(['!status', '!inventory', '!quest', '!shop'])
+    if roll < 0.95:
+        return rng.choice(['!join fire', '!choose race elf', '!nick Hero'])
+    if roll < 0.98:
+        return '!xp'
+    return '!leaderboard'
+
+async def timed(latencies, coro):
+    started = time.perf_counter()
+    await coro
+    latencies.append(time.perf_counter() - started)
+
+async def run_bounded(factories, concurrency):
+    """Run coroutine factories with at most `concurrency` in flight, like a busy gateway"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(factory):
+        async with semaphore:
+            await factory()
+
+    await asyncio.gather(*(one(factory) for factory in factories))
+
+# --- Scenarios ---
+
+async def message_scenario(args, guilds, rng):
+    latencies = []
+    factories = []
+    for _ in range(args.messages):
+        guild = rng.choice(guilds)
+        member = rng.choice(guild.members)
+        channel = guild.channels[rng.choice(list(guild.channels)[:3])]
+        message = FakeMessage(member, channel, pick_content(rng))
+        factories.append(lambda message=message: timed(latencies, bot.bot.on_message(message)))
+
+    started = time.perf_counter()
+    await run_bounded(factories, args.concurrency)
+    await bot.message_xp_buffer.flush()
+    return latencies, time.perf_counter() - started
+
+async def presence_scenario(args, guilds, rng):
+    latencies = []
+    factories = []
+    for _ in range(args.presence):
+        guild = rng.choice(guilds)
+        after = FakePresence(rng.choice(guild.members))
+        factories.append(lambda after=after: timed(latencies, bot.bot.on_presence_update(after, after)))
+
+    started = time.perf_counter()
+    await run_bounded(factories, args.concurrency)
+    return latencies, time.perf_counter() - started
+
+async def duel_scenario(args, guilds, rng):
+    turn_latencies = []
+    for duel in range(args.duels):
+        guild = rng.choice(guilds)
+        player1, player2 = rng.sample(guild.members, 2)
+        lobby = guild.channels[list(guild.channels)[0]]
+
+        before = set(guild.channels)
+        await bot.handle_duel_command(FakeMessage(player1, lobby, f'!duel challenge <@{player2.id}>'))
+        created = [guild.channels[channel_id] for channel_id in set(guild.channels) - before]
+        if not created:
+            continue
+        duel_channel = created[0]
+
+        for turn in range(10):
+            attacker = player1 if turn % 2 == 0 else player2
+            await timed(turn_latencies, bot.handle_duel_command(
+                FakeMessage(attacker, duel_channel, '!duel attack physical')
+            ))
+    return turn_latencies
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--guilds', type=int, default=3)
+    parser.add_argument('--users', type=int, default=2000, help='members per guild')
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--presence', type=int, default=50000)
+    parser.add_argument('--duels', type=int, default=20)
+    parser.add_argument('--concurrency', type=int, default=200, help='events in flight')
+    parser.add_argument('--latency', type=float, default=0.05, help='fake backend latency (s)')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    guilds = [FakeGuild(guild_id, args.users) for guild_id in range(1, args.guilds + 1)]
+    guild_map = {guild.id: guild for guild in guilds}
+    bot.bot.get_guild = guild_map.get
+    bot.bot.get_channel = lambda channel_id: next(
+        (guild.channels[channel_id] for guild in guilds if channel_id in guild.channels), None
+    )
+    bot.bot.wait_until_ready = lambda: asyncio.sleep(0)
+
+    backend = FakeBackend(latency=args.latency, error_rate=args.error_rate, seed=args.seed)
+    await backend.start(port=PORT)
+    lag = LoopLagMonitor()
+    lag.start()
+
+    print(f"🧪 {args.guilds} guilds x {args.users} users, backend latency {args.latency * 1000:.0f} ms, "
+          f"errors {args.error_rate:.0%}")
+    try:
+        msg_latencies, msg_elapsed = await message_scenario(args, guilds, rng)
+        msg_calls = backend.total_calls
+        print(f"\non_message: {args.messages} messages in {msg_elapsed:.2f}s "
+              f"({args.messages / msg_elapsed:,.0f} msg/s)")
+        print(f"  latency  {describe(msg_latencies)}")
+        print(f"  backend calls/message {msg_calls / args.messages:.3f}  ({dict(backend.calls.most_common(6))})")
+
+        presence_latencies, presence_elapsed = await presence_scenario(args, guilds, rng)
+        print(f"\non_presence_update: {args.presence} events in {presence_elapsed:.2f}s "
+              f"({args.presence / presence_elapsed:,.0f} events/s), "
+              f"{bot.user_activity.presence_dropped} coalesced")
+        print(f"  latency  {describe(presence_latencies)}")
+
+        calls_before = backend.total_calls
+        started = time.perf_counter()
+        await bot.run_presence_tick()
+        await bot.announcement_buffer.flush_all()
+        print(f"\npresence tick: {len(bot.user_activity)} tracked users in {time.perf_counter() - started:.2f}s, "
+              f"{backend.total_calls - calls_before} backend calls")
+
+        turn_latencies = await duel_scenario(args, guilds, rng)
+        print(f"\nduel flow: {args.duels} duels, {len(turn_latencies)} turns")
+        print(f"  turn     {describe(turn_latencies)}")
+
+        await lag.stop()
+        print(f"\nevent-loop lag  {describe(lag.lags)}")
+        print(f"backend: {backend.total_calls} calls, max {backend.max_in_flight} in flight; "
+              f"client {bot.api_client.stats()}")
+    finally:
+        await bot.deletion_scheduler.stop()
+        await bot.api_client.close()
+        await backend.stop()
+
+if __name__ == "__main__":
+    asyncio.run(main())
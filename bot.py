@@ -1,56 +1,658 @@
 import discord
-import requests
+import aiohttp
+import aiohttp.web
 import os
+import re
+import signal
+import json
+import sqlite3
+import subprocess
 import asyncio
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+import bisect
+import contextlib
+import hashlib
+import heapq
+import hmac
+import sys
+import threading
+import time
+import traceback
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional, Set, Tuple
 
 BOT_TOKEN = os.getenv('BOT_TOKEN')
 PHP_API_URL = os.getenv('PHP_API_URL')
+XP_API_URL = PHP_API_URL.replace('discord.php', 'xp-handler.php') if PHP_API_URL else None
+
+# Backend HTTP pool
+API_MAX_CONCURRENCY = int(os.getenv('API_MAX_CONCURRENCY', '20'))
+API_POOL_SIZE = int(os.getenv('API_POOL_SIZE', '50'))
+
+# Backend priority lanes: concurrency budget of interactive and background
+# lanes (the duel lane may use all API_MAX_CONCURRENCY slots)
+API_INTERACTIVE_CONCURRENCY = int(os.getenv('API_INTERACTIVE_CONCURRENCY', str(max(1, API_MAX_CONCURRENCY - 2))))
+API_BACKGROUND_CONCURRENCY = int(os.getenv('API_BACKGROUND_CONCURRENCY', str(max(1, API_MAX_CONCURRENCY * 3 // 5))))
+
+# Prometheus metrics endpoint (disabled unless METRICS_PORT is set)
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+
+# Event-loop stall watchdog: report stalls longer than this many seconds
+# (0 disables), optionally rewriting the worst-offenders report to a file
+STALL_WATCHDOG_THRESHOLD = float(os.getenv('STALL_WATCHDOG_THRESHOLD', '0'))
+STALL_REPORT_PATH = os.getenv('STALL_REPORT_PATH')
+
+# Users allowed to run owner-only debug commands besides the guild owner
+BOT_OWNER_IDS = {int(user_id) for user_id in os.getenv('BOT_OWNER_IDS', '').split(',') if user_id.strip()}
+
+# Backend backpressure: max queued + in-flight requests (background work may
+# use only a share of it) and circuit breaker failures / open seconds
+API_MAX_QUEUE = int(os.getenv('API_MAX_QUEUE', '200'))
+API_BACKGROUND_QUEUE_SHARE = float(os.getenv('API_BACKGROUND_QUEUE_SHARE', '0.5'))
+API_BREAKER_THRESHOLD = int(os.getenv('API_BREAKER_THRESHOLD', '5'))
+API_BREAKER_COOLDOWN = float(os.getenv('API_BREAKER_COOLDOWN', '30'))
+
+# Message XP batching: flush every N seconds or after N buffered messages
+MESSAGE_XP_FLUSH_INTERVAL = float(os.getenv('MESSAGE_XP_FLUSH_INTERVAL', '30'))
+MESSAGE_XP_FLUSH_SIZE = int(os.getenv('MESSAGE_XP_FLUSH_SIZE', '200'))
+# Parallel users when the backend has no batch message_xp (one request per message)
+MESSAGE_XP_CONCURRENCY = int(os.getenv('MESSAGE_XP_CONCURRENCY', '10'))
+
+# Presence XP tick: users per bulk request, parallel requests when falling back
+PRESENCE_XP_CHUNK_SIZE = int(os.getenv('PRESENCE_XP_CHUNK_SIZE', '500'))
+PRESENCE_XP_CONCURRENCY = int(os.getenv('PRESENCE_XP_CONCURRENCY', '10'))
+
+# Character data cache (get_user_data)
+CHARACTER_CACHE_TTL = float(os.getenv('CHARACTER_CACHE_TTL', '300'))
+CHARACTER_CACHE_SIZE = int(os.getenv('CHARACTER_CACHE_SIZE', '5000'))
+
+# Response cache TTLs (seconds) for read-only xp-handler.php actions, 0 disables
+RESPONSE_CACHE_TTLS = {
+    'leaderboard': float(os.getenv('LEADERBOARD_CACHE_TTL', '60')),
+    'get_stats': float(os.getenv('STATS_CACHE_TTL', '15')),
+    'get_cooldowns': float(os.getenv('COOLDOWNS_CACHE_TTL', '5')),
+}
+
+# Nickname reconciliation: debounce window and per-guild member.edit budget
+NICKNAME_DEBOUNCE = float(os.getenv('NICKNAME_DEBOUNCE', '2'))
+NICKNAME_EDIT_RATE = int(os.getenv('NICKNAME_EDIT_RATE', '10'))
+NICKNAME_EDIT_PER = float(os.getenv('NICKNAME_EDIT_PER', '10'))
+
+# Presence events for a user within this many seconds of the last one are dropped
+PRESENCE_COALESCE_WINDOW = float(os.getenv('PRESENCE_COALESCE_WINDOW', '60'))
+
+# Level-up announcements to the same channel within this window are merged
+ANNOUNCE_WINDOW = float(os.getenv('ANNOUNCE_WINDOW', '2'))
+
+# Presence level-up channel per guild: "guild_id:channel_id,..." (default: ANNOUNCE_CHANNEL_NAME)
+ANNOUNCE_CHANNELS = {
+    int(guild_id): int(channel_id)
+    for guild_id, channel_id in (
+        pair.split(':') for pair in os.getenv('ANNOUNCE_CHANNELS', '').split(',') if pair.strip()
+    )
+}
+ANNOUNCE_CHANNEL_NAME = os.getenv('ANNOUNCE_CHANNEL_NAME', 'general')
+
+# Parallel channel deletions during duel cleanup
+DUEL_CLEANUP_CONCURRENCY = int(os.getenv('DUEL_CLEANUP_CONCURRENCY', '5'))
+
+# Backend push endpoint for duel events (HMAC-signed with DUEL_EVENTS_SECRET,
+# disabled unless both port and secret are set); polling for expired duels
+# then only runs every DUEL_CLEANUP_FALLBACK_INTERVAL seconds
+DUEL_EVENTS_PORT = int(os.getenv('DUEL_EVENTS_PORT', '0'))
+DUEL_EVENTS_HOST = os.getenv('DUEL_EVENTS_HOST', '0.0.0.0')
+DUEL_EVENTS_SECRET = os.getenv('DUEL_EVENTS_SECRET')
+DUEL_EVENTS_ENABLED = bool(DUEL_EVENTS_PORT and DUEL_EVENTS_SECRET)
+DUEL_CLEANUP_FALLBACK_INTERVAL = float(os.getenv('DUEL_CLEANUP_FALLBACK_INTERVAL', '3600'))
+
+# Local store for duel channels and deletion deadlines (survives restarts),
+# also shared by sharded worker processes for presence XP claims
+DUEL_DB_PATH = os.getenv('DUEL_DB_PATH', 'duels.db')
+
+# Sharding: SHARD_COUNT ("auto" or a number) switches to AutoShardedClient.
+# With SHARD_PROCESSES > 1, `python bot.py` launches that many workers, each
+# owning a contiguous range of the SHARD_COUNT shards (passed as SHARD_IDS)
+_shard_count = os.getenv('SHARD_COUNT', '')
+SHARDED = bool(_shard_count)
+SHARD_COUNT = int(_shard_count) if _shard_count.isdigit() else None
+SHARD_PROCESSES = int(os.getenv('SHARD_PROCESSES', '1'))
+SHARD_IDS = [int(shard_id) for shard_id in os.getenv('SHARD_IDS', '').split(',') if shard_id.strip()] or None
+SHARD_START_DELAY = float(os.getenv('SHARD_START_DELAY', '5'))
+if SHARD_IDS and not SHARD_COUNT:
+    # owns_guild() needs the total to map guilds to shards
+    raise SystemExit("❌ SHARD_IDS needs a numeric SHARD_COUNT")
+
+# A user awarded presence XP by any worker within this many seconds is skipped
+PRESENCE_CLAIM_WINDOW = float(os.getenv('PRESENCE_CLAIM_WINDOW', '840'))
+
+# Member cache policy: "full" caches every member and chunks guilds before
+# on_ready, "lazy" caches members as they show up (online at login, joins,
+# updates) without chunking, "minimal" caches no members and drops the
+# presences intent, so presence XP only counts message activity
+MEMBER_CACHE_POLICY = os.getenv('MEMBER_CACHE_POLICY', 'full')
 
 intents = discord.Intents.default()
 intents.message_content = True
-intents.presences = True
+intents.presences = MEMBER_CACHE_POLICY != 'minimal'
 intents.members = True
 
-bot = discord.Client(intents=intents)
+MEMBER_CACHE_OPTIONS = {
+    'full': {},
+    'lazy': {'chunk_guilds_at_startup': False},
+    'minimal': {'member_cache_flags': discord.MemberCacheFlags.none(), 'chunk_guilds_at_startup': False},
+}
+
+class TesseadeClient(discord.AutoShardedClient if SHARDED else discord.Client):
+    async def setup_hook(self):
+        # Runs once per process, before connecting
+        restore_duel_channels()
+        loop_lag_monitor.start()
+        if STALL_WATCHDOG_THRESHOLD > 0:
+            stall_watchdog.start(asyncio.get_running_loop())
+        if METRICS_PORT:
+            await metrics_server.start(METRICS_HOST, METRICS_PORT)
+        if DUEL_EVENTS_PORT and not DUEL_EVENTS_SECRET:
+            print("⚠️ DUEL_EVENTS_PORT is set without DUEL_EVENTS_SECRET, duel event listener disabled")
+        elif DUEL_EVENTS_ENABLED and IS_CLEANUP_WORKER:
+            await duel_event_server.start(DUEL_EVENTS_HOST, DUEL_EVENTS_PORT)
+    
+    async def close(self):
+        # Stop periodic jobs first so the final flush doesn't race a tick
+        await supervisor.stop()
+        
+        # Don't lose buffered message counts or announcements on shutdown
+        try:
+            await message_xp_buffer.drain()
+            await announcement_buffer.flush_all()
+        except Exception as e:
+            print(f"❌ Error flushing message XP on shutdown: {e}")
+        
+        await super().close()
+        # Release pooled backend connections
+        await api_client.close()
+        await metrics_server.stop()
+        await duel_event_server.stop()
+        await deletion_scheduler.stop()
+        stall_watchdog.stop()
+        duel_store.close()
+        presence_claims.close()
+
+bot = TesseadeClient(intents=intents, **MEMBER_CACHE_OPTIONS[MEMBER_CACHE_POLICY], **({'shard_count': SHARD_COUNT, 'shard_ids': SHARD_IDS} if SHARDED else {}))
+
+def owns_guild(guild_id: int) -> bool:
+    """Whether this process's shards receive events for the guild"""
+    if not SHARD_IDS:
+        return True
+    return (guild_id >> 22) % SHARD_COUNT in SHARD_IDS
+
+# Only one worker polls the backend for expired duels (it deletes other workers' channels over REST)
+IS_CLEANUP_WORKER = not SHARD_IDS or 0 in SHARD_IDS
+
+# === ACTIVITY TRACKING ===
+
+class ActivityRecord:
+    __slots__ = ('user_id', 'username', 'last_seen', 'slot', 'guild_id')
+    
+    def __init__(self, user_id: str, username: str, last_seen: float, slot: int, guild_id: Optional[int] = None):
+        # user_id is the API (string) form, records are keyed by the int id
+        self.user_id = user_id
+        self.username = username
+        self.last_seen = last_seen  # time.monotonic()
+        self.slot = slot
+        self.guild_id = guild_id  # guild the user was last seen in
+
+class ActivityTracker:
+    """Last-seen records bucketed in a timing wheel of `slot_seconds` slots.
+    
+    Touching a user moves it to the current slot, so listing recently active
+    users only walks the recent slots and expiring idle users pops whole old
+    slots, instead of scanning every tracked user.
+    """
+    
+    def __init__(self, slot_seconds: float = 60, coalesce_window: float = 60):
+        self.slot_seconds = slot_seconds
+        self.coalesce_window = coalesce_window
+        self.records: Dict[int, ActivityRecord] = {}
+        self.slots: Dict[int, Set[int]] = {}  # slot: member ids last seen in that slot
+        self._slot_order = deque()  # slots in creation (= time) order
+        self.presence_events = 0
+        self.presence_dropped = 0
+    
+    def __len__(self):
+        return len(self.records)
+    
+    def __contains__(self, member_id):
+        return member_id in self.records
+    
+    def get(self, member_id) -> Optional[ActivityRecord]:
+        return self.records.get(member_id)
+    
+    def touch(self, member_id: int, username: str, now: Optional[float] = None, guild_id: Optional[int] = None):
+        if now is None:
+            now = time.monotonic()
+        slot = int(now // self.slot_seconds)
+        
+        record = self.records.get(member_id)
+        if record is None:
+            self.records[member_id] = ActivityRecord(str(member_id), username, now, slot, guild_id)
+        else:
+            record.username = username
+            record.last_seen = now
+            if guild_id is not None:
+                record.guild_id = guild_id
+            if record.slot == slot:
+                return
+            self.slots[record.slot].discard(member_id)
+            record.slot = slot
+        
+        bucket = self.slots.get(slot)
+        if bucket is None:
+            bucket = self.slots[slot] = set()
+            self._slot_order.append(slot)
+        bucket.add(member_id)
+    
+    def record_presence(self, member_id: int, username: str, guild_id: Optional[int] = None) -> bool:
+        """touch() for presence events, dropping repeats inside coalesce_window"""
+        self.presence_events += 1
+        now = time.monotonic()
+        
+        record = self.records.get(member_id)
+        if record is not None and now - record.last_seen < self.coalesce_window:
+            self.presence_dropped += 1
+            return False
+        
+        self.touch(member_id, username, now, guild_id)
+        return True
+    
+    def active_since(self, seconds: float, now: Optional[float] = None) -> List[ActivityRecord]:
+        """Records seen in the last `seconds`"""
+        if now is None:
+            now = time.monotonic()
+        cutoff = now - seconds
+        first_slot = int(cutoff // self.slot_seconds)
+        
+        active = []
+        for slot in reversed(self._slot_order):
+            if slot < first_slot:
+                break
+            for member_id in self.slots[slot]:
+                record = self.records[member_id]
+                if record.last_seen >= cutoff:
+                    active.append(record)
+        return active
+    
+    def expire(self, max_age: float, now: Optional[float] = None) -> int:
+        """Forget users idle for longer than max_age (slot granularity)"""
+        if now is None:
+            now = time.monotonic()
+        cutoff_slot = int((now - max_age) // self.slot_seconds)
+        
+        expired = 0
+        while self._slot_order and self._slot_order[0] < cutoff_slot:
+            for member_id in self.slots.pop(self._slot_order.popleft()):
+                del self.records[member_id]
+                expired += 1
+        return expired
 
 # Track user activity for presence XP
-user_activity = {}
+user_activity = ActivityTracker(coalesce_window=PRESENCE_COALESCE_WINDOW)
+
+class PresenceClaims:
+    """Last presence XP award per user in the shared SQLite file.
+    
+    Sharded workers each track the users seen in their own guilds, so a user in
+    guilds on two workers shows up in both ticks; claim() hands every user to
+    the first worker per PRESENCE_CLAIM_WINDOW.
+    """
+    
+    def __init__(self, path: str, window: float):
+        self.path = path
+        self.window = window
+        self._db: Optional[sqlite3.Connection] = None
+    
+    @property
+    def db(self) -> sqlite3.Connection:
+        # Used from a worker thread, one tick at a time
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS presence_claims ('
+                ' user_id TEXT PRIMARY KEY,'
+                ' claimed_at REAL NOT NULL)'
+            )
+        return self._db
+    
+    def claim(self, user_ids: List[str]) -> Set[str]:
+        """Subset of user_ids nobody claimed within the window, now claimed by us"""
+        now = time.time()
+        claimed = set()
+        db = self.db
+        
+        db.execute('BEGIN IMMEDIATE')  # serializes claims across workers
+        try:
+            for start in range(0, len(user_ids), 500):
+                chunk = user_ids[start:start + 500]
+                taken = {row[0] for row in db.execute(
+                    f"SELECT user_id FROM presence_claims WHERE claimed_at > ? "
+                    f"AND user_id IN ({','.join('?' * len(chunk))})",
+                    (now - self.window, *chunk)
+                )}
+                fresh = [user_id for user_id in chunk if user_id not in taken]
+                db.executemany('INSERT OR REPLACE INTO presence_claims VALUES (?, ?)', [(user_id, now) for user_id in fresh])
+                claimed.update(fresh)
+            db.execute('DELETE FROM presence_claims WHERE claimed_at <= ?', (now - 2 * self.window,))
+            db.execute('COMMIT')
+        except Exception:
+            db.execute('ROLLBACK')
+            raise
+        return claimed
+    
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+presence_claims = PresenceClaims(DUEL_DB_PATH, PRESENCE_CLAIM_WINDOW)
 
 # Dictionary to track duel channels and their associated data
-duel_channels: Dict[int, Dict] = {}  # channel_id: {'duel_id': int, 'players': [id1, id2], 'delete_task': task}
+duel_channels: Dict[int, Dict] = {}  # channel_id: {'duel_id': int, 'players': [id1, id2]}
+
+# Duel channel name -> (guild_id, channel_id), used by expired duel cleanup
+duel_channel_index: Dict[str, Tuple[int, int]] = {}
+
+# === CACHING ===
+
+class TTLCache:
+    """LRU + TTL cache where concurrent lookups of a key share one load"""
+    
+    def __init__(self, ttl: float = 300, max_size: int = 5000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: OrderedDict = OrderedDict()  # key: (expires_at, value)
+        self._inflight: Dict[object, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0  # lookups that joined an in-flight request
+    
+    async def get(self, key, loader, ttl: Optional[float] = None, keep=None):
+        """Cached value for key, else await loader() (None results, or those keep() rejects, aren't stored)"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            del self._entries[key]
+        
+        task = self._inflight.get(key)
+        if task is None:
+            self.misses += 1
+            task = asyncio.create_task(self._load(key, loader, self.ttl if ttl is None else ttl, keep))
+            self._inflight[key] = task
+        else:
+            self.shared += 1
+        
+        # Shield so a cancelled caller doesn't cancel the shared request
+        return await asyncio.shield(task)
+    
+    async def _load(self, key, loader, ttl, keep):
+        task = asyncio.current_task()
+        try:
+            value = await loader()
+        finally:
+            current = self._inflight.get(key) is task
+            if current:
+                del self._inflight[key]
+        
+        # Don't store a result that was invalidated while in flight
+        if current and value is not None and (keep is None or keep(value)):
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        
+        return value
+    
+    def invalidate(self, key):
+        self._entries.pop(key, None)
+        self._inflight.pop(key, None)
+    
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.shared
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'shared': self.shared,
+            'hit_rate': (self.hits + self.shared) / lookups if lookups else 0.0,
+        }
+
+# === COMMAND ROUTER ===
+
+# Commands that change faction/race/spec/nickname
+NICKNAME_TRIGGERS = (
+    '!join ',           # faction change
+    '!choose race ',    # race change
+    '!choose spec',     # specialization change
+    '!nickname ',       # custom nickname change
+    '!nick '            # nickname alias
+)
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+class LatencyHistogram:
+    __slots__ = ('counts', 'total', 'count')
+    
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)  # last bucket is +Inf
+        self.total = 0.0
+        self.count = 0
+    
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+    
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th observation"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return LATENCY_BUCKETS[index] if index < len(LATENCY_BUCKETS) else float('inf')
+        return float('inf')
+
+class CommandRouter:
+    """Command dispatch table: exact matches first, then by first word"""
+    
+    MAX_LABELS = 100  # cap distinct passthrough commands we keep stats for
+    
+    def __init__(self):
+        self.exact_routes: Dict[str, object] = {}
+        self.prefix_routes: Dict[str, object] = {}
+        self.default = None
+        self.stats: Dict[str, LatencyHistogram] = {}
+    
+    def exact(self, command: str):
+        def register(handler):
+            self.exact_routes[command] = handler
+            return handler
+        return register
+    
+    def prefix(self, command: str):
+        def register(handler):
+            self.prefix_routes[command] = handler
+            return handler
+        return register
+    
+    def fallback(self, handler):
+        self.default = handler
+        return handler
+    
+    def resolve(self, content: str):
+        """Return (label, handler) for a command message"""
+        handler = self.exact_routes.get(content)
+        if handler:
+            return content, handler
+        
+        first_word = content.split(None, 1)[0]
+        handler = self.prefix_routes.get(first_word)
+        if handler:
+            return first_word, handler
+        
+        return first_word, self.default
+    
+    async def dispatch(self, message):
+        label, handler = self.resolve(message.content)
+        if label not in self.stats and len(self.stats) >= self.MAX_LABELS:
+            label = 'other'
+        
+        started = time.perf_counter()
+        try:
+            await handler(message)
+        finally:
+            histogram = self.stats.get(label)
+            if histogram is None:
+                histogram = self.stats[label] = LatencyHistogram()
+            histogram.observe(time.perf_counter() - started)
+
+router = CommandRouter()
+
+# === TASK SUPERVISOR ===
+
+class PeriodicJob:
+    def __init__(self, name: str, interval: float, tick, offset: float = 0):
+        self.name = name
+        self.interval = interval
+        self.tick = tick
+        self.offset = offset
+        self.task: Optional[asyncio.Task] = None
+        self.running = False  # inside tick()
+        self.next_run = 0.0  # time.time()
+        self.runs = 0
+        self.failures = 0  # consecutive
+        self.last_duration = 0.0
+        self.last_error: Optional[str] = None
+    
+    def next_boundary(self, now: float) -> float:
+        """Next wall-clock multiple of interval (+ offset) after now"""
+        return now + self.interval - (now - self.offset) % self.interval
+
+class TaskSupervisor:
+    """Keeps one task per periodic job, ticking on wall-clock boundaries.
+    
+    start() is idempotent, so on_ready firing again after a reconnect doesn't
+    add loops. A failing tick is retried after an exponential backoff (capped
+    at the interval) and the job goes back to its boundaries once it succeeds.
+    """
+    
+    def __init__(self, backoff: float = 5, shutdown_grace: float = 10):
+        self.backoff = backoff
+        self.shutdown_grace = shutdown_grace
+        self.jobs: Dict[str, PeriodicJob] = {}
+        self.stopping = False
+    
+    def every(self, name: str, interval: float, offset: float = 0, enabled: bool = True):
+        """Decorator: run the coroutine function every `interval` seconds"""
+        def decorator(func):
+            if enabled:
+                self.jobs[name] = PeriodicJob(name, interval, func, offset)
+            return func
+        return decorator
+    
+    def start(self):
+        self.stopping = False
+        for job in self.jobs.values():
+            if job.task is None or job.task.done():
+                job.task = asyncio.create_task(self._run(job), name=f"job:{job.name}")
+                print(f"🔁 {job.name} started (every {job.interval:g}s)")
+    
+    async def _run(self, job: PeriodicJob):
+        job.next_run = job.next_boundary(time.time())
+        while not self.stopping:
+            await asyncio.sleep(max(0.0, job.next_run - time.time()))
+            
+            started = time.monotonic()
+            job.running = True
+            try:
+                await job.tick()
+            except Exception as e:
+                job.failures += 1
+                job.last_error = f"{type(e).__name__}: {e}"
+                delay = min(job.interval, self.backoff * 2 ** (job.failures - 1))
+                print(f"❌ {job.name} failed ({job.failures}x), retrying in {delay:g}s: {job.last_error}")
+                job.next_run = time.time() + delay
+                continue
+            finally:
+                job.running = False
+                job.last_duration = time.monotonic() - started
+            
+            job.runs += 1
+            job.failures = 0
+            job.next_run = job.next_boundary(time.time())
+    
+    async def stop(self):
+        """Cancel idle jobs now, give ticks in progress `shutdown_grace` seconds to finish"""
+        self.stopping = True
+        tasks = [job.task for job in self.jobs.values() if job.task and not job.task.done()]
+        busy = []
+        for job in self.jobs.values():
+            if job.task and not job.task.done():
+                if job.running:
+                    busy.append(job.task)
+                else:
+                    job.task.cancel()
+        
+        if busy:
+            # Jobs return after their current tick
+            await asyncio.wait(busy, timeout=self.shutdown_grace)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        
+        for job in self.jobs.values():
+            job.task = None
+
+supervisor = TaskSupervisor()
 
 @bot.event
 async def on_ready():
     print(f'✅ Bot connected as {bot.user}')
     print(f'📡 API URL: {PHP_API_URL}')
     
-    # Start presence XP task (15 minuti)
-    bot.loop.create_task(presence_xp_loop())
-    print("⏰ Presence XP task started (15 minute intervals)")
+    # Index duel channels that already exist (also those the store doesn't know about)
+    for guild in bot.guilds:
+        category = discord.utils.get(guild.categories, name="Duels")
+        if category:
+            for channel in category.text_channels:
+                index_duel_channel(channel)
+    print(f"⚔️ Indexed {len(duel_channel_index)} duel channels")
+    
+    prune_missing_duel_channels()
+    
+    if SHARD_IDS:
+        print(f"🧩 Worker for shards {SHARD_IDS} of {SHARD_COUNT}: {len(bot.guilds)} guilds")
     
-    # Start duel cleanup task
-    bot.loop.create_task(cleanup_duel_channels())
-    print("🗑️ Duel cleanup task started")
+    # Presence XP, duel cleanup and message XP flush jobs (no-op on reconnects)
+    supervisor.start()
 
 @bot.event
 async def on_message(message):
     if message.author == bot.user:
         return
     
-    user_id = str(message.author.id)
     username = message.author.display_name
     
     # Update user activity (for presence tracking)
-    user_activity[user_id] = {
-        'username': username,
-        'last_seen': datetime.now(),
-        'user_obj': message.author
-    }
+    user_activity.touch(message.author.id, username, guild_id=message.guild.id if message.guild else None)
     
-    # Process message XP for every message (ma XP solo ogni 10 messaggi)
-    await process_message_xp(user_id, username, message.channel)
+    # Count message XP for every message (buffered, no network call here)
+    await process_message_xp(str(message.author.id), username, message.channel)
     
     # Handle commands
     if not message.content.startswith('!'):
@@ -58,75 +660,50 @@ async def on_message(message):
         
     print(f"📨 Command: '{message.content}' from {message.author}")
     
-    # === SPECIAL COMMANDS ===
-    if message.content == '!xp force':
-        # Force presence XP (for testing)
-        await force_presence_xp(message)
-        return
-    elif message.content.startswith('!xp'):
-        await handle_xp_command(message)
-        return
-    elif message.content == '!leaderboard':
-        await handle_leaderboard_command(message)
-        return
-    elif message.content == '!debug nickname':
-        await debug_nickname(message)
-        return
-    
-    # === DUEL COMMANDS ===
-    if message.content.startswith('!duel'):
-        await handle_duel_command(message)
-        return
-    
-    # === REGULAR GAME COMMANDS ===
-    data = {
-        'user_id': user_id,
-        'username': username,
-        'command': message.content
-    }
-    
-    await send_to_api(data, message.channel, 'command')
-    
-    # *** NICKNAME UPDATE TRIGGERS ***
-    # Update nickname when character elements change
-    nickname_triggers = [
-        '!join ',           # faction change
-        '!choose race ',    # race change  
-        '!choose spec',     # specialization change
-        '!nickname ',       # custom nickname change
-        '!nick '           # nickname alias
-    ]
+    await router.dispatch(message)
+
+@bot.event
+async def on_guild_channel_create(channel):
+    announcement_channels.pop(channel.guild.id, None)
+    if is_duel_channel(channel):
+        index_duel_channel(channel)
+
+@bot.event
+async def on_guild_channel_update(before, after):
+    if before.name != after.name or before.position != after.position:
+        announcement_channels.pop(after.guild.id, None)
+    if before.name != after.name:
+        unindex_duel_channel(before)
+    if is_duel_channel(after):
+        index_duel_channel(after)
+
+@bot.event
+async def on_guild_channel_delete(channel):
+    announcement_channels.pop(channel.guild.id, None)
+    unindex_duel_channel(channel)
     
-    if any(message.content.startswith(trigger) for trigger in nickname_triggers):
-        print(f"🎨 Nickname update triggered by: {message.content}")
-        await asyncio.sleep(1)  # Wait for database update
-        await update_full_nickname(message.author, message.channel)
+    # Channel is gone, drop its duel context and pending deletion
+    duel = duel_channels.pop(channel.id, None)
+    if duel:
+        deletion_scheduler.cancel(channel.id)
+        duel_store.remove(channel.id)
 
 @bot.event
 async def on_member_update(before, after):
     """Track when users come online"""
     if after.status != discord.Status.offline and before.status == discord.Status.offline:
-        user_id = str(after.id)
-        user_activity[user_id] = {
-            'username': after.display_name,
-            'last_seen': datetime.now(),
-            'user_obj': after
-        }
+        user_activity.record_presence(after.id, after.display_name, after.guild.id)
         print(f"👋 {after.display_name} came online")
 
 @bot.event
 async def on_presence_update(before, after):
     """Track presence changes"""
     if after.status != discord.Status.offline:
-        user_id = str(after.id)
-        user_activity[user_id] = {
-            'username': after.display_name,
-            'last_seen': datetime.now(),
-            'user_obj': after
-        }
+        user_activity.record_presence(after.id, after.display_name, after.guild.id)
 
 # === DUEL SYSTEM FUNCTIONS ===
 
+@router.prefix('!duel')
 async def handle_duel_command(message):
     """Handle !duel commands with channel context"""
     
@@ -144,16 +721,9 @@ async def handle_duel_command(message):
     }
     
     try:
-        headers = {
-            'Content-Type': 'application/json',
-            'User-Agent': 'Mozilla/5.0 (compatible; TesseadeBot/1.0)',
-        }
-        
-        response = requests.post(PHP_API_URL, json=data, headers=headers, timeout=15)
+        status, result = await api_client.request('duel', data)
         
-        if response.status_code == 200:
-            result = response.json()
-            
+        if status == 200:
             # Handle response
             if isinstance(result, dict):
                 if 'response' in result:
@@ -189,11 +759,13 @@ async def create_duel_channel(ctx, channel_data: dict):
     """Create a private duel channel for two players"""
     guild = ctx.guild
     
-    # Get the players
+    # Get the players (fetched if the member cache doesn't hold them)
     try:
-        player1 = guild.get_member(int(channel_data['players'][0]))
-        player2 = guild.get_member(int(channel_data['players'][1]))
-    except (ValueError, KeyError) as e:
+        player1, player2 = await asyncio.gather(
+            get_or_fetch_member(guild, int(channel_data['players'][0])),
+            get_or_fetch_member(guild, int(channel_data['players'][1]))
+        )
+    except (ValueError, KeyError, IndexError) as e:
         print(f"❌ Error getting players: {e}")
         await ctx.channel.send("❌ Could not find players for duel!")
         return None
@@ -230,8 +802,10 @@ async def create_duel_channel(ctx, channel_data: dict):
         duel_channels[channel.id] = {
             'duel_id': channel_data['duel_id'],
             'players': channel_data['players'],
-            'delete_task': None
+            'guild_id': guild.id
         }
+        index_duel_channel(channel)
+        duel_store.save(channel, channel_data['duel_id'], channel_data['players'])
         
         # Send initial message
         embed = discord.Embed(
@@ -281,201 +855,843 @@ async def schedule_channel_deletion(channel_id: int, delay: int = 600):
     if channel_id not in duel_channels:
         return
     
-    async def delete_channel():
-        await asyncio.sleep(delay)
+    duel_store.set_delete_at(channel_id, time.time() + delay)
+    arm_channel_deletion(channel_id, delay)
+
+def arm_channel_deletion(channel_id: int, delay: float):
+    """Start (or restart) the in-memory deletion timer for a duel channel"""
+    deletion_scheduler.schedule(channel_id, time.time() + delay)
+
+# Seconds between the "will be deleted" notice and the deletion
+DELETION_NOTICE = 10
+
+class DeletionScheduler:
+    """One task for all duel channel deletions, driven by a min-heap of deadlines.
+    
+    Heap entries are [deadline, seq, channel_id, phase]: at the deadline the
+    'notice' phase posts the warning and re-arms the channel in the 'delete'
+    phase DELETION_NOTICE seconds later. Rescheduling pushes a new entry and
+    cancelling blanks the old one in place (O(log n) / O(1)); blanked entries
+    are skipped when they reach the top. Channels that come due together are
+    handled as one batch, `concurrency` at a time.
+    """
+    
+    UNAVAILABLE_RETRY = 60  # seconds before retrying a channel whose guild is unavailable
+    
+    def __init__(self, concurrency: int = 5):
+        self.concurrency = concurrency
+        self._heap: List[list] = []
+        self._entries: Dict[int, list] = {}  # channel_id: live heap entry
+        self._seq = 0
+        self._stale = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._batches: Set[asyncio.Task] = set()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._remote: Set[int] = set()  # other workers' channels, handled over REST
+        self.deleted = 0
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    def __contains__(self, channel_id):
+        return channel_id in self._entries
+    
+    def schedule(self, channel_id: int, deadline: float, phase: str = 'notice', remote: bool = False):
+        """Arm (or re-arm) a channel's deletion at `deadline` (time.time())"""
+        self._discard(channel_id)
+        if remote:
+            self._remote.add(channel_id)
+        self._seq += 1
+        entry = [deadline, self._seq, channel_id, phase]
+        self._entries[channel_id] = entry
+        heapq.heappush(self._heap, entry)
         
-        # Get the channel
-        channel = bot.get_channel(channel_id)
-        if channel:
-            try:
-                await channel.send("📢 This duel channel will be deleted in 10 seconds...")
-                await asyncio.sleep(10)
-                await channel.delete(reason="Duel ended")
-                
-                # Remove from tracking
-                if channel_id in duel_channels:
-                    del duel_channels[channel_id]
-                    
-            except Exception as e:
-                print(f"❌ Error deleting channel: {e}")
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self._task = asyncio.create_task(self._run())
+        elif self._heap[0] is entry:
+            self._wakeup.set()  # new earliest deadline
     
-    # Cancel any existing delete task
-    if duel_channels[channel_id].get('delete_task'):
-        duel_channels[channel_id]['delete_task'].cancel()
+    def cancel(self, channel_id: int):
+        self._discard(channel_id)
+        self._remote.discard(channel_id)
     
-    # Create new delete task
-    task = asyncio.create_task(delete_channel())
-    duel_channels[channel_id]['delete_task'] = task
-
-async def cleanup_duel_channels():
-    """Background task to clean up expired duel channels"""
-    await bot.wait_until_ready()
+    def pending(self) -> List[Tuple[int, float, str]]:
+        """(channel_id, deadline, phase), soonest first"""
+        return sorted(((channel_id, entry[0], entry[3]) for channel_id, entry in self._entries.items()),
+                      key=lambda item: item[1])
     
-    while not bot.is_closed():
-        try:
-            # Query database for channels to delete
-            data = {
-                'command': '!system cleanup_duels',
-                'user_id': 'system',
-                'username': 'system'
-            }
-            
-            headers = {
-                'Content-Type': 'application/json',
-                'User-Agent': 'Mozilla/5.0 (compatible; TesseadeBot/1.0)',
-            }
-            
-            response = requests.post(PHP_API_URL, json=data, headers=headers, timeout=10)
-            
-            if response.status_code == 200:
-                result = response.json()
-                
-                if result.get('channels_to_delete'):
-                    for channel_name in result['channels_to_delete']:
-                        # Find and delete channel
-                        for guild in bot.guilds:
-                            channel = discord.utils.get(
-                                guild.text_channels, 
-                                name=channel_name
-                            )
-                            if channel:
-                                try:
-                                    await channel.delete(reason="Duel expired")
-                                    print(f"🗑️ Deleted expired duel channel: {channel_name}")
-                                except:
-                                    pass
-                        
-        except Exception as e:
-            print(f"❌ Cleanup error: {e}")
+    def _discard(self, channel_id: int):
+        entry = self._entries.pop(channel_id, None)
+        if entry is None:
+            return
+        entry[2] = None
+        self._stale += 1
+        if self._stale > 64 and self._stale > len(self._entries):
+            self._heap = list(self._entries.values())
+            heapq.heapify(self._heap)
+            self._stale = 0
+    
+    def _pop_due(self, now: float) -> List[Tuple[int, str]]:
+        due = []
+        while self._heap and (self._heap[0][2] is None or self._heap[0][0] <= now):
+            _, _, channel_id, phase = heapq.heappop(self._heap)
+            if channel_id is None:
+                self._stale -= 1
+                continue
+            del self._entries[channel_id]
+            due.append((channel_id, phase))
+        return due
+    
+    async def _run(self):
+        await bot.wait_until_ready()
         
-        # Run every 5 minutes
-        await asyncio.sleep(300)
-
-# === ENHANCED NICKNAME SYSTEM ===
-
-async def update_full_nickname(member, channel):
-    """Aggiorna nickname completo: [faction][race][spec] CustomName"""
-    try:
-        print(f"🔍 Getting full character data for {member}")
+        while True:
+            due = self._pop_due(time.time())
+            if due:
+                batch = asyncio.create_task(self._run_batch(due))
+                self._batches.add(batch)
+                batch.add_done_callback(self._batches.discard)
+            
+            self._wakeup.clear()
+            timeout = self._heap[0][0] - time.time() if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+    
+    async def _run_batch(self, due: List[Tuple[int, str]]):
+        async def run(channel_id, phase):
+            async with self._semaphore:
+                try:
+                    await self._run_phase(channel_id, phase)
+                except Exception as e:
+                    print(f"❌ Error deleting channel: {e}")
         
-        # Get complete character data
-        char_data = await get_character_data(str(member.id))
-        if not char_data:
-            print(f"❌ No character data found for {member}")
+        await asyncio.gather(*(run(channel_id, phase) for channel_id, phase in due))
+    
+    async def _run_phase(self, channel_id: int, phase: str):
+        if channel_id in self._remote:
+            await self._run_remote_phase(channel_id, phase)
             return
         
-        # Check bot permissions
-        if not member.guild.me.guild_permissions.manage_nicknames:
-            print(f"❌ Bot has no 'Manage Nicknames' permission in {member.guild}")
+        # Get the channel
+        channel = bot.get_channel(channel_id)
+        if not channel:
+            duel = duel_channels.get(channel_id)
+            guild = bot.get_guild(duel['guild_id']) if duel else None
+            if guild is not None and guild.unavailable:
+                # Outage, not a deletion: try again later, like prune_missing_duel_channels()
+                self.schedule(channel_id, time.time() + self.UNAVAILABLE_RETRY, phase)
+                return
+            
+            # Deleted while we were offline
+            duel_channels.pop(channel_id, None)
+            duel_store.remove(channel_id)
             return
         
-        # Build new nickname
-        new_nick = build_character_nickname(char_data)
-        current_nick = member.display_name
-        
-        if current_nick == new_nick:
-            print(f"✅ Nickname already correct for {member}: {new_nick}")
+        if phase == 'notice':
+            await channel.send(f"📢 This duel channel will be deleted in {DELETION_NOTICE} seconds...")
+            # Unless the duel got re-armed meanwhile
+            if channel_id not in self._entries:
+                self.schedule(channel_id, time.time() + DELETION_NOTICE, 'delete')
             return
         
+        await channel.delete(reason="Duel ended")
+        self.deleted += 1
+        
+        # Remove from tracking
+        duel_channels.pop(channel_id, None)
+        duel_store.remove(channel_id)
+    
+    async def _run_remote_phase(self, channel_id: int, phase: str):
+        # Same phases for a channel in another worker's guild
         try:
-            await member.edit(nick=new_nick[:32])  # Discord limit
-            print(f"✅ Updated full nickname: {member} -> {new_nick}")
-            
-        except discord.Forbidden:
-            print(f"❌ Permission denied changing nickname for {member}")
-            if member.id != member.guild.owner_id:  # Don't spam owner
-                await channel.send("⚠️ Can't change your nickname. Make sure bot role is above your role in server settings.")
+            if phase == 'notice':
+                await send_remote_message(channel_id, f"📢 This duel channel will be deleted in {DELETION_NOTICE} seconds...")
+                if channel_id not in self._entries:
+                    self.schedule(channel_id, time.time() + DELETION_NOTICE, 'delete', remote=True)
+                return
             
-        except discord.HTTPException as e:
-            print(f"❌ Discord error for {member}: {e}")
-            
-    except Exception as e:
-        print(f"❌ Error updating nickname for {member}: {e}")
+            await bot.http.delete_channel(channel_id, reason="Duel ended")
+            self.deleted += 1
+        except discord.NotFound:
+            pass
+        
+        if channel_id not in self._entries:
+            self._remote.discard(channel_id)
+        duel_store.remove(channel_id)
+    
+    async def stop(self):
+        tasks = [task for task in (self._task, *self._batches) if task and not task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
 
-def build_character_nickname(char_data):
-    """Build nickname from character data: [emojis] CustomName"""
-    emojis = []
+deletion_scheduler = DeletionScheduler(DUEL_CLEANUP_CONCURRENCY)
+
+class DuelStore:
+    """SQLite copy of duel_channels plus deletion deadlines"""
     
-    # Add faction emoji
-    if char_data.get('faction_emoji'):
-        emojis.append(char_data['faction_emoji'])
+    def __init__(self, path: str):
+        self.path = path
+        self._db: Optional[sqlite3.Connection] = None
     
-    # Add race emoji  
-    if char_data.get('race_emoji'):
-        emojis.append(char_data['race_emoji'])
+    @property
+    def db(self) -> sqlite3.Connection:
+        # Opened lazily so importing bot.py doesn't create the file
+        if self._db is None:
+            self._db = sqlite3.connect(self.path)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('PRAGMA synchronous=NORMAL')
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS duel_channels ('
+                ' channel_id INTEGER PRIMARY KEY,'
+                ' guild_id INTEGER NOT NULL,'
+                ' name TEXT NOT NULL,'
+                ' duel_id TEXT,'
+                ' players TEXT NOT NULL,'
+                ' delete_at REAL)'
+            )
+            self._db.commit()
+        return self._db
     
-    # Add specialization emoji
-    if char_data.get('spec_emoji'):
-        emojis.append(char_data['spec_emoji'])
+    def save(self, channel, duel_id, players):
+        with self.db:
+            self.db.execute(
+                'INSERT OR REPLACE INTO duel_channels VALUES (?, ?, ?, ?, ?, NULL)',
+                (channel.id, channel.guild.id, channel.name, json.dumps(duel_id), json.dumps(players))
+            )
     
-    # Get display name (custom nickname or username)
-    display_name = char_data.get('custom_nickname') or char_data.get('username') or 'Unknown'
+    def set_delete_at(self, channel_id: int, delete_at: float):
+        with self.db:
+            self.db.execute('UPDATE duel_channels SET delete_at = ? WHERE channel_id = ?', (delete_at, channel_id))
     
-    # Clean display name of any existing emojis
-    clean_name = clean_all_emojis(display_name)
+    def remove(self, channel_id: int):
+        with self.db:
+            self.db.execute('DELETE FROM duel_channels WHERE channel_id = ?', (channel_id,))
     
-    # Build final nickname
-    if emojis:
-        return f"{''.join(emojis)} {clean_name}"
-    else:
-        return clean_name
-
-def clean_all_emojis(text):
-    """Remove all emojis from text"""
-    # Extended emoji list covering factions, races, specializations
-    all_emojis = [
-        # Factions
-        '🌸', '⚡', '🌊', '🔥', '🌿', '❄️', '🌙', '☀️', '⭐', '💎',
-        '🗡️', '🛡️', '🏹', '⚔️', '🔮', '📜', '🧙', '🐉', '🦅', '🐺',
-        '🏰', '⚖️', '🎭', '🌺', '🍃', '💫', '🔱', '👑', '🌟', '💀',
-        '👹', '🎃', '🌋', '🌪️', '⛈️', '🌈', '🦋', '🕷️', '🐍',
-        # Races  
-        '👤', '🧝', '🧔', '👺', '😈', '🧚', '🦸', '🧛', '🧞', '👽',
-        '🤖', '💀', '🐺', '🦅', '🐲', '🐯', '🦁', '🐻', '🦊', '🐱',
-        # Specializations
-        '⚔️', '🔮', '🏹', '🤝', '🗡️', '🛡️', '🔨', '🪓', '🏺', '📿',
-        '💊', '🎯', '🎪', '🎨', '🎭', '🎵', '📚', '🔬', '⚗️', '🔧'
-    ]
+    def find_channel(self, name: str) -> Optional[int]:
+        row = self.db.execute('SELECT channel_id FROM duel_channels WHERE name = ?', (name,)).fetchone()
+        return row[0] if row else None
     
-    cleaned = text.strip()
+    def find_duel(self, channel_id: Optional[int] = None, name: Optional[str] = None,
+                  duel_id=None) -> Optional[Tuple[int, int]]:
+        """(channel_id, guild_id) of a stored duel, by whichever key is given"""
+        if channel_id is not None:
+            query, args = 'channel_id = ?', (channel_id,)
+        elif name is not None:
+            query, args = 'name = ?', (name,)
+        elif duel_id is not None:
+            # duel_id is stored JSON-encoded, and events may send 7 or "7"
+            candidates = {json.dumps(duel_id), json.dumps(str(duel_id))}
+            if str(duel_id).isdigit():
+                candidates.add(json.dumps(int(duel_id)))
+            query, args = f"duel_id IN ({', '.join('?' * len(candidates))})", tuple(candidates)
+        else:
+            return None
+        row = self.db.execute(f'SELECT channel_id, guild_id FROM duel_channels WHERE {query}', args).fetchone()
+        return (row[0], row[1]) if row else None
     
-    # Remove emojis from start
-    while cleaned and any(cleaned.startswith(emoji) for emoji in all_emojis):
-        for emoji in all_emojis:
-            if cleaned.startswith(emoji):
-                cleaned = cleaned[len(emoji):].strip()
-                break
+    def load(self):
+        """Yield (channel_id, guild_id, name, duel_id, players, delete_at)"""
+        rows = self.db.execute('SELECT channel_id, guild_id, name, duel_id, players, delete_at FROM duel_channels')
+        for channel_id, guild_id, name, duel_id, players, delete_at in rows:
+            yield channel_id, guild_id, name, json.loads(duel_id), json.loads(players), delete_at
     
-    return cleaned if cleaned else text
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
 
-async def get_character_data(user_id):
-    """Get complete character data from API"""
-    try:
+duel_store = DuelStore(DUEL_DB_PATH)
+
+def restore_duel_channels():
+    """Rehydrate duel_channels and re-arm pending deletions from the store"""
+    now = time.time()
+    restored = armed = 0
+    
+    for channel_id, guild_id, name, duel_id, players, delete_at in duel_store.load():
+        if not owns_guild(guild_id):
+            continue  # another worker's duel
+        
+        duel_channels[channel_id] = {
+            'duel_id': duel_id,
+            'players': players,
+            'guild_id': guild_id
+        }
+        duel_channel_index[name] = (guild_id, channel_id)
+        restored += 1
+        
+        if delete_at is not None:
+            arm_channel_deletion(channel_id, max(0.0, delete_at - now))
+            armed += 1
+    
+    print(f"⚔️ Restored {restored} duel channels, {armed} pending deletions")
+
+def prune_missing_duel_channels():
+    """Forget restored duels whose channel was deleted while offline"""
+    for channel_id, duel in list(duel_channels.items()):
+        guild = bot.get_guild(duel['guild_id'])
+        if guild is not None and guild.unavailable:
+            continue  # outage, its channels aren't cached yet
+        if bot.get_channel(channel_id) is None:
+            duel_channels.pop(channel_id)
+            deletion_scheduler.cancel(channel_id)
+            duel_store.remove(channel_id)
+
+@supervisor.every('duel_cleanup', DUEL_CLEANUP_FALLBACK_INTERVAL if DUEL_EVENTS_ENABLED else 300,
+                  enabled=IS_CLEANUP_WORKER)
+async def cleanup_duel_channels():
+    """Delete the duel channels the backend reports as expired (every 5 minutes, or as fallback to pushes)"""
+    # Query database for channels to delete
+    data = {
+        'command': '!system cleanup_duels',
+        'user_id': 'system',
+        'username': 'system'
+    }
+    
+    status, result = await api_client.request('cleanup', data)
+    
+    if status == 200:
+        if result.get('channels_to_delete'):
+            await delete_duel_channels_by_name(result['channels_to_delete'])
+
+def is_duel_channel(channel) -> bool:
+    if channel.id in duel_channels:
+        return True
+    category = getattr(channel, 'category', None)
+    return isinstance(channel, discord.TextChannel) and category is not None and category.name == "Duels"
+
+def index_duel_channel(channel):
+    duel_channel_index[channel.name] = (channel.guild.id, channel.id)
+
+def unindex_duel_channel(channel):
+    # Only drop the entry if it still points at this channel
+    if duel_channel_index.get(channel.name, (None, None))[1] == channel.id:
+        del duel_channel_index[channel.name]
+
+async def delete_duel_channels_by_name(channel_names):
+    """Delete expired duel channels by name, DUEL_CLEANUP_CONCURRENCY at a time"""
+    semaphore = asyncio.Semaphore(DUEL_CLEANUP_CONCURRENCY)
+    
+    async def delete(channel_name):
+        location = duel_channel_index.get(channel_name)
+        if not location:
+            # Not indexed yet (e.g. created while a guild was unavailable), look it up by name
+            for guild in bot.guilds:
+                category = discord.utils.get(guild.categories, name="Duels")
+                channel = discord.utils.get(category.text_channels, name=channel_name) if category else None
+                if channel:
+                    index_duel_channel(channel)
+                    location = (guild.id, channel.id)
+                    break
+        if not location:
+            if SHARD_IDS:
+                await delete_remote_duel_channel(channel_name)
+            return
+        
+        guild = bot.get_guild(location[0])
+        channel = guild.get_channel(location[1]) if guild else None
+        if not channel:
+            duel_channel_index.pop(channel_name, None)
+            return
+        
+        async with semaphore:
+            try:
+                await channel.delete(reason="Duel expired")
+                print(f"🗑️ Deleted expired duel channel: {channel_name}")
+            except Exception as e:
+                print(f"❌ Error deleting expired duel channel {channel_name}: {e}")
+    
+    await asyncio.gather(*(delete(channel_name) for channel_name in dict.fromkeys(channel_names)))
+
+async def delete_remote_duel_channel(channel_name):
+    """Delete a duel channel in another worker's guild through the REST API"""
+    channel_id = duel_store.find_channel(channel_name)
+    if channel_id is None:
+        return
+    
+    try:
+        await bot.http.delete_channel(channel_id, reason="Duel expired")
+        print(f"🗑️ Deleted expired duel channel: {channel_name} (other shard)")
+    except discord.NotFound:
+        duel_store.remove(channel_id)
+    except Exception as e:
+        print(f"❌ Error deleting expired duel channel {channel_name}: {e}")
+
+async def send_remote_message(channel_id: int, content: str):
+    """Post to a channel that isn't in this worker's cache"""
+    with discord.http.handle_message_parameters(content=content[:MESSAGE_LIMIT]) as params:
+        await bot.http.send_message(channel_id, params=params)
+
+# === DUEL EVENTS ===
+
+def find_duel_channel(event: dict) -> Optional[int]:
+    """Tracked duel channel an event refers to, by channel_id, channel_name or duel_id"""
+    try:
+        if event.get('channel_id') is not None:
+            channel_id = int(event['channel_id'])
+            return channel_id if channel_id in duel_channels else None
+    except (TypeError, ValueError):
+        return None
+    
+    if event.get('channel_name'):
+        location = duel_channel_index.get(event['channel_name'])
+        return location[1] if location and location[1] in duel_channels else None
+    
+    if event.get('duel_id') is not None:
+        for channel_id, duel in duel_channels.items():
+            if str(duel['duel_id']) == str(event['duel_id']):
+                return channel_id
+    return None
+
+async def handle_duel_event(event) -> bool:
+    """Apply one pushed event, returns whether it was handled"""
+    if not isinstance(event, dict):
+        return False
+    kind = event.get('event') or ('channels_to_delete' if 'channels_to_delete' in event else None)
+    
+    # Same payload as the !system cleanup_duels reply
+    if kind == 'channels_to_delete':
+        channel_names = event.get('channels_to_delete') or []
+        if not isinstance(channel_names, list):
+            return False
+        await delete_duel_channels_by_name([str(name) for name in channel_names])
+        return True
+    
+    channel_id = find_duel_channel(event)
+    if channel_id is None:
+        if SHARD_IDS:
+            return await handle_remote_duel_event(kind, event)
+        return False  # unknown duel
+    channel = bot.get_channel(channel_id)
+    
+    if kind == 'duel_ended':
+        # e.g. a turn timeout decided on the backend
+        if channel and event.get('message'):
+            await channel.send(str(event['message'])[:MESSAGE_LIMIT])
+        await schedule_channel_deletion(channel_id, float(event.get('delete_delay', 600)))
+        return True
+    
+    if kind == 'duel_message':
+        if channel and event.get('message'):
+            await channel.send(str(event['message'])[:MESSAGE_LIMIT])
+            return True
+    
+    return False
+
+async def handle_remote_duel_event(kind, event) -> bool:
+    """handle_duel_event() for another worker's duel, found in duel_store and acted on over REST"""
+    if kind not in ('duel_ended', 'duel_message'):
+        return False
+    
+    try:
+        channel_id = int(event['channel_id']) if event.get('channel_id') is not None else None
+    except (TypeError, ValueError):
+        return False
+    location = duel_store.find_duel(channel_id, event.get('channel_name'), event.get('duel_id'))
+    if location is None or owns_guild(location[1]):
+        return False  # unknown duel, or ours but no longer tracked
+    channel_id = location[0]
+    
+    if kind == 'duel_ended':
+        if event.get('message'):
+            await send_remote_message(channel_id, str(event['message']))
+        delay = float(event.get('delete_delay', 600))
+        # The owning worker re-arms from delete_at if it restarts first
+        duel_store.set_delete_at(channel_id, time.time() + delay)
+        deletion_scheduler.schedule(channel_id, time.time() + delay, remote=True)
+        return True
+    
+    if event.get('message'):
+        await send_remote_message(channel_id, str(event['message']))
+        return True
+    return False
+
+class DuelEventServer:
+    """POST /duel-events for the backend to push duel events.
+    
+    Requests carry X-Tesseade-Timestamp (unix seconds) and X-Tesseade-Signature:
+    "sha256=" + hex HMAC-SHA256 of "<timestamp>.<body>" keyed with
+    DUEL_EVENTS_SECRET. The body is one event or {"events": [...]}. The reply
+    is 200 when every event was handled, else 404 listing the indexes of the
+    unhandled ones so the backend can retry just those.
+    """
+    
+    MAX_SKEW = 300  # seconds a signed request stays valid
+    
+    def __init__(self, secret: Optional[str]):
+        self.secret = (secret or '').encode()
+        self.received = 0
+        self.handled = 0
+        self.rejected = 0
+        self._runner: Optional[aiohttp.web.AppRunner] = None
+    
+    async def start(self, host: str, port: int):
+        app = aiohttp.web.Application(client_max_size=256 * 1024)
+        app.router.add_post('/duel-events', self.handle)
+        self._runner = aiohttp.web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await aiohttp.web.TCPSite(self._runner, host, port).start()
+        print(f"📬 Duel event listener at http://{host}:{port}/duel-events")
+    
+    def verify(self, headers, body: bytes) -> bool:
+        timestamp = headers.get('X-Tesseade-Timestamp', '')
+        try:
+            if abs(time.time() - float(timestamp)) > self.MAX_SKEW:
+                return False
+        except ValueError:
+            return False
+        
+        expected = 'sha256=' + hmac.new(self.secret, timestamp.encode() + b'.' + body, hashlib.sha256).hexdigest()
+        return hmac.compare_digest(expected, headers.get('X-Tesseade-Signature', ''))
+    
+    async def handle(self, request):
+        body = await request.read()
+        if not self.verify(request.headers, body):
+            self.rejected += 1
+            return aiohttp.web.json_response({'error': 'invalid signature'}, status=401)
+        
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            return aiohttp.web.json_response({'error': 'invalid JSON'}, status=400)
+        
+        if not bot.is_ready():
+            # The backend keeps the event and retries (or the fallback poll picks it up)
+            return aiohttp.web.json_response({'error': 'not ready'}, status=503)
+        
+        events = payload['events'] if isinstance(payload, dict) and isinstance(payload.get('events'), list) else [payload]
+        unhandled = []
+        for index, event in enumerate(events):
+            try:
+                if await handle_duel_event(event):
+                    continue
+            except Exception as e:
+                print(f"❌ Error handling duel event {event!r:.100}: {e}")
+            unhandled.append(index)
+        
+        handled = len(events) - len(unhandled)
+        self.received += len(events)
+        self.handled += handled
+        return aiohttp.web.json_response(
+            {'ok': not unhandled, 'received': len(events), 'handled': handled, 'unhandled': unhandled},
+            status=404 if unhandled else 200
+        )
+    
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+duel_event_server = DuelEventServer(DUEL_EVENTS_SECRET)
+
+# === ENHANCED NICKNAME SYSTEM ===
+
+async def get_or_fetch_member(guild, member_id: int):
+    """Cached member, or fetched over REST when the cache policy didn't keep it"""
+    member = guild.get_member(member_id)
+    if member is not None:
+        return member
+    
+    try:
+        return await guild.fetch_member(member_id)
+    except discord.NotFound:
+        return None
+    except discord.HTTPException as e:
+        print(f"❌ Error fetching member {member_id}: {e}")
+        return None
+
+async def update_full_nickname(member, channel):
+    """Aggiorna nickname completo: [faction][race][spec] CustomName"""
+    try:
+        # Prefer the cached member, it carries the latest nickname
+        latest = await get_or_fetch_member(member.guild, member.id)
+        if latest is None:
+            print(f"❌ {member} is no longer in {member.guild}")
+            return
+        member = latest
+        
+        print(f"🔍 Getting full character data for {member}")
+        
+        # Get complete character data
+        char_data = await get_character_data(str(member.id))
+        if not char_data:
+            print(f"❌ No character data found for {member}")
+            return
+        
+        # Check bot permissions
+        if not member.guild.me.guild_permissions.manage_nicknames:
+            print(f"❌ Bot has no 'Manage Nicknames' permission in {member.guild}")
+            return
+        
+        # Build new nickname
+        new_nick = build_character_nickname(char_data)
+        current_nick = member.display_name
+        
+        if current_nick == new_nick:
+            print(f"✅ Nickname already correct for {member}: {new_nick}")
+            return
+        
+        try:
+            await member.edit(nick=new_nick[:32])  # Discord limit
+            print(f"✅ Updated full nickname: {member} -> {new_nick}")
+            
+        except discord.Forbidden:
+            print(f"❌ Permission denied changing nickname for {member}")
+            if channel and member.id != member.guild.owner_id:  # Don't spam owner
+                await channel.send("⚠️ Can't change your nickname. Make sure bot role is above your role in server settings.")
+            
+        except discord.HTTPException as e:
+            print(f"❌ Discord error for {member}: {e}")
+            
+    except Exception as e:
+        print(f"❌ Error updating nickname for {member}: {e}")
+
+class RateBucket:
+    """Token bucket: `rate` operations per `per` seconds"""
+    
+    def __init__(self, rate: int, per: float):
+        self.rate = rate
+        self.per = per
+        self.tokens = float(rate)
+        self.updated = time.monotonic()
+    
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate / self.per)
+            self.updated = now
+            
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            
+            await asyncio.sleep((1 - self.tokens) * self.per / self.rate)
+
+class NicknameReconciler:
+    """Debounced background nickname updates, paced per guild"""
+    
+    def __init__(self, debounce: float = 2, edit_rate: int = 10, edit_per: float = 10):
+        self.debounce = debounce
+        self.edit_rate = edit_rate
+        self.edit_per = edit_per
+        self._pending: Dict[Tuple[int, int], Dict] = {}  # (guild_id, member_id): {'member', 'channel', 'handle'}
+        self._queues: Dict[int, deque] = {}  # guild_id: entries ready to update
+        self._queued: Set[Tuple[int, int]] = set()  # keys of the entries in _queues
+        self._workers: Dict[int, asyncio.Task] = {}
+        self._buckets: Dict[int, RateBucket] = {}
+        self.scheduled = 0
+        self.coalesced = 0
+        self.reconciled = 0
+    
+    def schedule(self, member, channel=None):
+        """Update member's nickname once triggers stop arriving for `debounce` seconds"""
+        key = (member.guild.id, member.id)
+        self.scheduled += 1
+        
+        entry = self._pending.get(key)
+        if entry:
+            entry['handle'].cancel()
+            self.coalesced += 1
+        
+        handle = asyncio.get_running_loop().call_later(self.debounce, self._ready, key)
+        self._pending[key] = {'member': member, 'channel': channel, 'handle': handle}
+    
+    def reconcile_guild(self, guild, members=None) -> int:
+        """Queue every (non-bot) member of a guild, e.g. after a backend migration"""
+        count = 0
+        for member in guild.members if members is None else members:
+            if member.bot:
+                continue
+            key = (guild.id, member.id)
+            if key in self._pending or key in self._queued:
+                continue  # already on its way
+            character_cache.invalidate(str(member.id))
+            self._enqueue(guild.id, {'member': member, 'channel': None})
+            count += 1
+        return count
+    
+    def pending_count(self) -> int:
+        return len(self._pending) + sum(len(queue) for queue in self._queues.values())
+    
+    def _ready(self, key):
+        entry = self._pending.pop(key, None)
+        if entry:
+            self._enqueue(key[0], entry)
+    
+    def _enqueue(self, guild_id, entry):
+        key = (guild_id, entry['member'].id)
+        if key in self._queued:
+            return
+        self._queued.add(key)
+        self._queues.setdefault(guild_id, deque()).append(entry)
+        if guild_id not in self._workers:
+            self._workers[guild_id] = asyncio.create_task(self._guild_worker(guild_id))
+    
+    async def _guild_worker(self, guild_id):
+        queue = self._queues[guild_id]
+        bucket = self._buckets.get(guild_id)
+        if bucket is None:
+            bucket = self._buckets[guild_id] = RateBucket(self.edit_rate, self.edit_per)
+        
+        try:
+            while queue:
+                entry = queue.popleft()
+                self._queued.discard((guild_id, entry['member'].id))
+                await bucket.acquire()
+                
+                await update_full_nickname(entry['member'], entry['channel'])
+                self.reconciled += 1
+        finally:
+            del self._workers[guild_id]
+            if not queue:
+                del self._queues[guild_id]
+
+nickname_reconciler = NicknameReconciler(NICKNAME_DEBOUNCE, NICKNAME_EDIT_RATE, NICKNAME_EDIT_PER)
+
+def build_character_nickname(char_data):
+    """Build nickname from character data: [emojis] CustomName"""
+    emojis = []
+    
+    register_nickname_emojis(
+        char_data.get('faction_emoji'),
+        char_data.get('race_emoji'),
+        char_data.get('spec_emoji')
+    )
+    
+    # Add faction emoji
+    if char_data.get('faction_emoji'):
+        emojis.append(char_data['faction_emoji'])
+    
+    # Add race emoji  
+    if char_data.get('race_emoji'):
+        emojis.append(char_data['race_emoji'])
+    
+    # Add specialization emoji
+    if char_data.get('spec_emoji'):
+        emojis.append(char_data['spec_emoji'])
+    
+    # Get display name (custom nickname or username)
+    display_name = char_data.get('custom_nickname') or char_data.get('username') or 'Unknown'
+    
+    # Clean display name of any existing emojis
+    clean_name = clean_all_emojis(display_name)
+    
+    # Build final nickname
+    if emojis:
+        return f"{''.join(emojis)} {clean_name}"
+    else:
+        return clean_name
+
+# Emojis used for factions, races and specializations
+NICKNAME_EMOJIS = frozenset([
+    # Factions
+    '🌸', '⚡', '🌊', '🔥', '🌿', '❄️', '🌙', '☀️', '⭐', '💎',
+    '🗡️', '🛡️', '🏹', '⚔️', '🔮', '📜', '🧙', '🐉', '🦅', '🐺',
+    '🏰', '⚖️', '🎭', '🌺', '🍃', '💫', '🔱', '👑', '🌟', '💀',
+    '👹', '🎃', '🌋', '🌪️', '⛈️', '🌈', '🦋', '🕷️', '🐍',
+    # Races
+    '👤', '🧝', '🧔', '👺', '😈', '🧚', '🦸', '🧛', '🧞', '👽',
+    '🤖', '🐲', '🐯', '🦁', '🐻', '🦊', '🐱',
+    # Specializations
+    '🤝', '🔨', '🪓', '🏺', '📿', '💊', '🎯', '🎪', '🎨', '🎵',
+    '📚', '🔬', '⚗️', '🔧'
+])
+
+# Any emoji: Extended_Pictographic code points that default to emoji presentation
+# (every supplementary one, a few BMP ones), BMP ones only when followed by
+# U+FE0F (so ★, ♠ or ✓ in a name stay), flags, keycaps, skin tones, tags and
+# ZWJ sequences
+_EMOJI_PRESENTATION = (
+    '\u231A\u231B\u23E9-\u23EC\u23F0\u23F3\u25FD\u25FE\u2614\u2615\u2648-\u2653\u267F\u2693'
+    '\u26A1\u26AA\u26AB\u26BD\u26BE\u26C4\u26C5\u26CE\u26D4\u26EA\u26F2\u26F3\u26F5\u26FA'
+    '\u26FD\u2705\u270A\u270B\u2728\u274C\u274E\u2753-\u2755\u2757\u2795-\u2797\u27B0\u27BF'
+    '\u2B1B\u2B1C\u2B50\u2B55'
+    '\U0001F000-\U0001F0FF\U0001F10D-\U0001F10F\U0001F12F\U0001F16C-\U0001F171\U0001F17E\U0001F17F'
+    '\U0001F18E\U0001F191-\U0001F19A\U0001F1AD-\U0001F1FF\U0001F201-\U0001F20F\U0001F21A\U0001F22F'
+    '\U0001F232-\U0001F23A\U0001F23C-\U0001F23F\U0001F249-\U0001F3FA\U0001F400-\U0001F53D'
+    '\U0001F546-\U0001F64F\U0001F680-\U0001F6FF\U0001F774-\U0001F77F\U0001F7D5-\U0001F7FF'
+    '\U0001F80C-\U0001F80F\U0001F848-\U0001F84F\U0001F85A-\U0001F85F\U0001F888-\U0001F88F'
+    '\U0001F8AE-\U0001F8FF\U0001F90C-\U0001F93A\U0001F93C-\U0001F945\U0001F947-\U0001FAFF'
+    '\U0001FC00-\U0001FFFD'
+)
+_EMOJI_TEXT_DEFAULT = (
+    '\u00A9\u00AE\u203C\u2049\u2122\u2139\u2194-\u2199\u21A9\u21AA\u2328\u2388\u23CF'
+    '\u23ED-\u23EF\u23F1\u23F2\u23F8-\u23FA\u24C2\u25AA\u25AB\u25B6\u25C0\u25FB\u25FC'
+    '\u2600-\u2605\u2607-\u2613\u2616-\u2647\u2654-\u267E\u2680-\u2685\u2690-\u2692'
+    '\u2694-\u26A0\u26A2-\u26A9\u26AC-\u26BC\u26BF-\u26C3\u26C6-\u26CD\u26CF-\u26D3'
+    '\u26D5-\u26E9\u26EB-\u26F1\u26F4\u26F6-\u26F9\u26FB\u26FC\u26FE-\u2704\u2708\u2709'
+    '\u270C-\u2712\u2714\u2716\u271D\u2721\u2733\u2734\u2744\u2747\u2763-\u2767\u27A1'
+    '\u2934\u2935\u2B05-\u2B07\u3030\u303D\u3297\u3299'
+)
+_EMOJI_MODIFIERS = '\uFE0F\U0001F3FB-\U0001F3FF\U000E0020-\U000E007F'
+_EMOJI_ELEMENT = f'(?:[{_EMOJI_PRESENTATION}]|[{_EMOJI_TEXT_DEFAULT}]\uFE0F)[{_EMOJI_MODIFIERS}]*'
+_GENERIC_EMOJI = (
+    f'{_EMOJI_ELEMENT}(?:\u200D{_EMOJI_ELEMENT})*'
+    f'|[0-9#*]\uFE0F?\u20E3'  # keycaps
+    f'|[{_EMOJI_MODIFIERS}\u200D\u20E3]+'  # stray joiners / selectors
+)
+
+_known_emojis = set(NICKNAME_EMOJIS)
+
+def _compile_emoji_prefix(emojis):
+    # Longest first so multi-codepoint emojis win over their prefixes
+    known = '|'.join(re.escape(emoji) for emoji in sorted(emojis, key=len, reverse=True))
+    return re.compile(f'(?:\\s*(?:{known}|{_GENERIC_EMOJI}))+\\s*')
+
+_emoji_prefix = _compile_emoji_prefix(_known_emojis)
+
+def register_nickname_emojis(*emojis):
+    """Teach the prefix stripper emojis returned by the backend"""
+    global _emoji_prefix
+    new_emojis = {emoji for emoji in emojis if emoji and emoji not in _known_emojis}
+    if new_emojis:
+        _known_emojis.update(new_emojis)
+        _emoji_prefix = _compile_emoji_prefix(_known_emojis)
+
+def clean_all_emojis(text):
+    """Remove all emojis from the start of text"""
+    cleaned = text.strip()
+    
+    match = _emoji_prefix.match(cleaned)
+    if match:
+        cleaned = cleaned[match.end():]
+    
+    return cleaned if cleaned else text
+
+character_cache = TTLCache(CHARACTER_CACHE_TTL, CHARACTER_CACHE_SIZE)
+
+async def get_character_data(user_id):
+    """Get complete character data (cached)"""
+    return await character_cache.get(user_id, lambda: fetch_character_data(user_id))
+
+async def fetch_character_data(user_id):
+    """Get complete character data from API"""
+    try:
         # Use the existing get_user_data endpoint
         data = {
             'user_id': user_id,
             'action': 'get_user_data'
         }
         
-        headers = {
-            'Content-Type': 'application/json',
-            'User-Agent': 'Mozilla/5.0 (compatible; TesseadeBot/1.0)',
-        }
-        
-        url = PHP_API_URL.replace('discord.php', 'xp-handler.php')
-        response = requests.post(url, json=data, headers=headers, timeout=10)
+        status, result = await api_client.request('character', data)
         
-        if response.status_code == 200:
-            result = response.json()
+        if status == 200:
             return result.get('user_data')
         else:
-            print(f"❌ API error getting character data: {response.status_code}")
+            print(f"❌ API error getting character data: {status}")
             
     except Exception as e:
         print(f"❌ Error getting character data: {e}")
         
     return None
 
+@router.exact('!debug nickname')
 async def debug_nickname(message):
     """Debug command per testare sistema nickname completo"""
     member = message.author
@@ -531,81 +1747,460 @@ async def debug_nickname(message):
     else:
         response += "❌ Could not get character data from API"
     
+    stats = character_cache.stats()
+    response += (
+        f"\n\nCache: {stats['size']} entries, {stats['hits']} hits, {stats['misses']} misses, "
+        f"{stats['shared']} shared ({stats['hit_rate']:.0%} hit rate)"
+    )
+    
     await message.channel.send(response)
 
+@router.exact('!debug reconcile')
+async def debug_reconcile(message):
+    """Queue a nickname update for every member of the guild"""
+    if not message.guild:
+        await message.channel.send("❌ This command only works in a server")
+        return
+    if not message.author.guild_permissions.manage_nicknames:
+        await message.channel.send("❌ You need the Manage Nicknames permission")
+        return
+    
+    members = None
+    if MEMBER_CACHE_POLICY != 'full':
+        # The cache only holds some members
+        members = [member async for member in message.guild.fetch_members(limit=None)]
+    
+    count = nickname_reconciler.reconcile_guild(message.guild, members)
+    await message.channel.send(f"🎨 Queued nickname reconciliation for {count} members")
+
 # === PRESENCE XP TASK ===
 
+@supervisor.every('presence_xp', 900)
 async def presence_xp_loop():
-    """Background task che gira ogni 15 minuti"""
-    await bot.wait_until_ready()
-    print("⏰ Presence XP loop ready, waiting 15 minutes...")
+    """Job che gira ogni 15 minuti (allineato all'orologio)"""
+    print("⏰ Processing presence XP (15 min interval)...")
+    await run_presence_tick()
+
+async def run_presence_tick():
+    """Award presence XP to everyone active in the last 17 minutes"""
+    tick_start = time.monotonic()
     
-    while not bot.is_closed():
-        try:
-            await asyncio.sleep(900)  # Wait 15 minutes
-            print("⏰ Processing presence XP (15 min interval)...")
-            
-            current_time = datetime.now()
-            processed_count = 0
+    # Clean old activity (older than 1 hour)
+    user_activity.expire(3600, tick_start)
+    
+    # If user was active in last 17 minutes, give presence XP
+    active_records = user_activity.active_since(1020, tick_start)  # 17 minutes buffer
+    if SHARD_IDS:
+        # Users also seen by another worker are awarded by whoever claims them first
+        claimed = await asyncio.to_thread(presence_claims.claim, [record.user_id for record in active_records])
+        active_records = [record for record in active_records if record.user_id in claimed]
+    active_users = [(record.user_id, record.username) for record in active_records]
+    user_guilds = {record.user_id: record.guild_id for record in active_records}
+    
+    results = await award_presence_xp(active_users)
+    success_count = failed_count = 0
+    
+    for user_id, username in active_users:
+        result = results.get(user_id)
+        if not result:
+            failed_count += 1
+            continue
+        if not result.get('success'):
+            continue  # cooldown etc.
+    
+        success_count += 1
+    
+        # If level up, announce it in the user's own guild
+        if result.get('level_up'):
+            guild_id = user_guilds[user_id]
+            if guild_id is None:
+                channel = find_announcement_channel()
+            else:
+                guild = bot.get_guild(guild_id)
+                channel = find_announcement_channel(guild) if guild else None
+            if channel:
+                announcement_buffer.announce(channel, f"⏰ **{username}** {result['message']}")
+    
+    skipped_count = len(active_users) - success_count - failed_count
+    presence_tick_seconds.observe(time.monotonic() - tick_start)
+    print(
+        f"⏰ Presence XP tick: {len(active_users)} active, {success_count} ok, "
+        f"{skipped_count} skipped, {failed_count} failed in {time.monotonic() - tick_start:.2f}s"
+    )
+    print(
+        f"👥 Presence events: {user_activity.presence_events} received, "
+        f"{user_activity.presence_dropped} coalesced"
+    )
+    print(
+        f"📣 Announcements: {announcement_buffer.lines_queued} level ups, "
+        f"{announcement_buffer.sends_saved} sends saved"
+    )
+    
+    return success_count, skipped_count, failed_count
+
+# Duration of each presence tick, for the metrics endpoint
+presence_tick_seconds = LatencyHistogram()
+
+# Flipped off once the backend answers presence_xp_bulk with an unknown action
+# (any other 200 reply without results falls back for that chunk only)
+presence_bulk_supported = True
+
+async def award_presence_xp(users):
+    """Award presence XP to (user_id, username) pairs, returns {user_id: result}"""
+    global presence_bulk_supported
+    results = {}
+    
+    # Skip users the backend would reject as still in cooldown
+    eligible = []
+    for user_id, username in users:
+        remaining = xp_cooldowns.remaining(user_id, 'presence_xp')
+        if remaining:
+            results[user_id] = cooldown_result(remaining)
+            xp_cooldowns.short_circuits += 1
+        else:
+            eligible.append((user_id, username))
+    users = eligible
+    
+    for start in range(0, len(users), PRESENCE_XP_CHUNK_SIZE):
+        chunk = users[start:start + PRESENCE_XP_CHUNK_SIZE]
+        
+        if presence_bulk_supported:
+            data = {
+                'action': 'presence_xp_bulk',
+                'users': [{'user_id': user_id, 'username': username} for user_id, username in chunk]
+            }
+            status, result = await send_xp_payload_status(data)
             
-            # Process XP for active users
-            for user_id, activity in list(user_activity.items()):
-                try:
-                    # If user was active in last 17 minutes, give presence XP
-                    time_since_activity = (current_time - activity['last_seen']).total_seconds()
-                    
-                    if time_since_activity < 1020:  # 17 minutes buffer
-                        result = await process_presence_xp(user_id, activity['username'])
-                        processed_count += 1
-                        
-                        # If level up, announce it
-                        if result and result.get('success') and result.get('level_up'):
-                            # Find a channel to announce
-                            channel = await find_announcement_channel()
-                            if channel:
-                                await channel.send(f"⏰ **{activity['username']}** {result['message']}")
-                    
-                    # Clean old activity (older than 1 hour)
-                    elif time_since_activity > 3600:
-                        del user_activity[user_id]
-                        
-                except Exception as e:
-                    print(f"❌ Error processing presence XP for {user_id}: {e}")
+            if status == 0 or status >= 500:
+                # Backend down or shedding: count the chunk as failed
+                # rather than retrying it as one request per user
+                continue
             
-            print(f"⏰ Processed presence XP for {processed_count} active users")
+            if status == 200 and isinstance(result, dict) and isinstance(result.get('results'), list):
+                for user_result in result['results']:
+                    results[str(user_result.get('user_id'))] = user_result
+                    xp_cooldowns.record(user_result.get('user_id'), 'presence_xp', user_result)
+                continue
             
-        except Exception as e:
-            print(f"❌ Presence XP loop error: {e}")
+            if status == 200:
+                # Backend without bulk presence XP, like MessageXPBuffer.flush()
+                if is_unknown_action(result):
+                    print("⚠️ Backend has no bulk presence XP, falling back to parallel requests")
+                    presence_bulk_supported = False
+            else:
+                continue  # 4xx: rejected, not retried
+        
+        results.update(await fan_out_presence_xp(chunk))
+    
+    return results
 
-async def find_announcement_channel():
-    """Find a suitable channel for announcements"""
-    for guild in bot.guilds:
-        # Try to find 'general' channel
-        channel = discord.utils.get(guild.text_channels, name='general')
+async def fan_out_presence_xp(users):
+    """One presence_xp request per user, at most PRESENCE_XP_CONCURRENCY at a time"""
+    semaphore = asyncio.Semaphore(PRESENCE_XP_CONCURRENCY)
+    
+    async def award(user_id, username):
+        async with semaphore:
+            return user_id, await process_presence_xp(user_id, username)
+    
+    return dict(await asyncio.gather(*(award(user_id, username) for user_id, username in users)))
+
+# Discord message length limit
+MESSAGE_LIMIT = 2000
+
+class AnnouncementBuffer:
+    """Merges level-up lines per channel within `window` seconds into as few messages as possible"""
+    
+    def __init__(self, window: float = 2):
+        self.window = window
+        self._pending: Dict[int, Tuple[object, List[str]]] = {}  # channel_id: (channel, lines)
+        self._timers: Dict[int, asyncio.TimerHandle] = {}
+        self._flushes: Set[asyncio.Task] = set()  # strong refs, the loop only keeps weak ones
+        self.lines_queued = 0
+        self.messages_sent = 0
+    
+    @property
+    def sends_saved(self) -> int:
+        return self.lines_queued - self.messages_sent - sum(len(lines) for _, lines in self._pending.values())
+    
+    def announce(self, channel, line: str):
+        entry = self._pending.get(channel.id)
+        if entry is None:
+            entry = self._pending[channel.id] = (channel, [])
+            self._timers[channel.id] = asyncio.get_running_loop().call_later(
+                self.window, self._start_flush, channel.id
+            )
+        entry[1].append(line[:MESSAGE_LIMIT])
+        self.lines_queued += 1
+    
+    def _start_flush(self, channel_id: int):
+        task = asyncio.create_task(self.flush(channel_id))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+    
+    async def flush(self, channel_id: int):
+        timer = self._timers.pop(channel_id, None)
+        if timer:
+            timer.cancel()
+        entry = self._pending.pop(channel_id, None)
+        if not entry:
+            return
+        
+        channel, lines = entry
+        for chunk in self._chunks(lines):
+            try:
+                await channel.send(chunk)
+            except Exception as e:
+                print(f"❌ Error announcing level ups: {e}")
+            self.messages_sent += 1
+    
+    async def flush_all(self):
+        # Let timer-started flushes finish sending first
+        await asyncio.gather(*self._flushes, return_exceptions=True)
+        for channel_id in list(self._pending):
+            await self.flush(channel_id)
+    
+    @staticmethod
+    def _chunks(lines):
+        chunk = ''
+        for line in lines:
+            if chunk and len(chunk) + 1 + len(line) > MESSAGE_LIMIT:
+                yield chunk
+                chunk = ''
+            chunk = f"{chunk}\n{line}" if chunk else line
+        if chunk:
+            yield chunk
+
+announcement_buffer = AnnouncementBuffer(ANNOUNCE_WINDOW)
+
+# guild_id: announcement channel_id, dropped on channel create/update/delete
+announcement_channels: Dict[int, int] = {}
+
+def find_announcement_channel(guild=None):
+    """Announcement channel for a guild (cached), or for the first guild"""
+    if guild is None:
+        if not bot.guilds:
+            return None
+        guild = bot.guilds[0]
+    
+    channel_id = announcement_channels.get(guild.id)
+    if channel_id is not None:
+        channel = guild.get_channel(channel_id)
         if channel:
             return channel
-        
-        # Otherwise use first available text channel
-        if guild.text_channels:
-            return guild.text_channels[0]
+    
+    channel = resolve_announcement_channel(guild)
+    if channel:
+        announcement_channels[guild.id] = channel.id
+    return channel
+
+def resolve_announcement_channel(guild):
+    # Configured channel for this guild
+    channel = guild.get_channel(ANNOUNCE_CHANNELS[guild.id]) if guild.id in ANNOUNCE_CHANNELS else None
+    if channel:
+        return channel
+    
+    # Try to find 'general' channel
+    channel = discord.utils.get(guild.text_channels, name=ANNOUNCE_CHANNEL_NAME)
+    if channel:
+        return channel
+    
+    # Otherwise use first available text channel
+    if guild.text_channels:
+        return guild.text_channels[0]
     
     return None
 
 # === XP PROCESSING FUNCTIONS ===
 
-async def process_message_xp(user_id, username, channel):
-    """Process XP from messages (ogni 10 messaggi)"""
-    result = await send_xp_request('message_xp', user_id, username)
+# XP actions the backend puts on a per-user cooldown
+XP_COOLDOWN_ACTIONS = {'message_xp': 'Message XP', 'presence_xp': 'Presence XP'}
+
+class CooldownMirror:
+    """Local copy of backend XP cooldowns, learned from type='cooldown' responses"""
     
-    # Solo mostra messaggi per XP ottenuto o level up
-    if result and result.get('success'):
-        if result.get('level_up'):
-            await channel.send(f"🎉 **{username}** {result['message']}")
+    def __init__(self):
+        self._until: Dict[Tuple[str, str], float] = {}  # (user_id, action): monotonic deadline
+        self._heap: List[Tuple[float, Tuple[str, str]]] = []
+        self.short_circuits = 0
+    
+    def __len__(self):
+        return len(self._until)
+    
+    def record(self, user_id, action, result):
+        """Remember the cooldown carried by an API result, if any"""
+        if isinstance(result, dict) and result.get('type') == 'cooldown' and result.get('remaining'):
+            key = (str(user_id), action)
+            until = time.monotonic() + float(result['remaining'])
+            self._until[key] = until
+            heapq.heappush(self._heap, (until, key))
+        self.evict()
+    
+    def remaining(self, user_id, action) -> float:
+        """Seconds left on a known cooldown, 0 if none"""
+        until = self._until.get((user_id, action))
+        if until is None:
+            return 0
+        return max(0.0, until - time.monotonic())
+    
+    def evict(self):
+        # Heap entries superseded by a later record() are skipped
+        now = time.monotonic()
+        while self._heap and self._heap[0][0] <= now:
+            until, key = heapq.heappop(self._heap)
+            if self._until.get(key) == until:
+                del self._until[key]
+
+xp_cooldowns = CooldownMirror()
+
+def cooldown_result(remaining: float) -> dict:
+    """Same shape as the API's cooldown response"""
+    return {'success': False, 'type': 'cooldown', 'remaining': int(remaining) + 1}
+
+class MessageXPBuffer:
+    """Per-user message counters flushed to the API as one message_xp batch"""
+    
+    def __init__(self, flush_size: int = 200, retry_delay: float = 30):
+        self.flush_size = flush_size
+        self.retry_delay = retry_delay
+        self.pending: Dict[str, Dict] = {}  # user_id: {'username': str, 'count': int, 'channel': channel}
+        self.pending_messages = 0
+        self._flush_task: Optional[asyncio.Task] = None
+        self._retry_at = 0.0  # no size-triggered flushes before this, after a failure
+        self.batch_supported = True  # flipped off once the backend rejects the batch action
+    
+    def add(self, user_id, username, channel):
+        entry = self.pending.get(user_id)
+        if entry is None:
+            self.pending[user_id] = {'username': username, 'count': 1, 'channel': channel}
+        else:
+            entry['username'] = username
+            entry['count'] += 1
+            entry['channel'] = channel  # level-up goes where the user last talked
+        
+        self.pending_messages += 1
+        
+        # Size threshold reached, flush without waiting for the interval
+        if (self.pending_messages >= self.flush_size
+                and not (self._flush_task and not self._flush_task.done())
+                and time.monotonic() >= self._retry_at):
+            self._flush_task = asyncio.create_task(self.flush())
+    
+    async def flush(self):
+        if not self.pending:
+            return
+        
+        batch, self.pending = self.pending, {}
+        self.pending_messages = 0
+        
+        # The backend would reject messages from users in a known cooldown: drop them
+        for user_id in [user_id for user_id in batch if xp_cooldowns.remaining(user_id, 'message_xp')]:
+            xp_cooldowns.short_circuits += batch.pop(user_id)['count']
+        if not batch:
+            return
+        
+        if not self.batch_supported:
+            await self._flush_per_message(batch)
+            return
+        
+        data = {
+            'action': 'message_xp',
+            'users': [
+                {'user_id': user_id, 'username': entry['username'], 'count': entry['count']}
+                for user_id, entry in batch.items()
+            ]
+        }
+        status, result = await send_xp_payload_status(data)
+        
+        if status == 0 or status >= 500:
+            # Put counts back so the next flush retries them
+            for user_id, entry in batch.items():
+                self._merge(user_id, entry)
+            self._retry_at = time.monotonic() + self.retry_delay
+            print(f"❌ Message XP flush failed, {len(batch)} users re-queued")
+            return
+        
+        if status != 200:
+            print(f"❌ Message XP flush rejected ({status}), {len(batch)} users dropped")
+            return
+        
+        if not isinstance(result, dict) or not isinstance(result.get('results'), list):
+            # Backend without batch message_xp: send the messages one by one
+            if is_unknown_action(result):
+                print("⚠️ Backend has no batch message XP, falling back to one request per message")
+                self.batch_supported = False
+            await self._flush_per_message(batch)
+            return
+        
+        # Solo mostra messaggi per level up
+        for user_result in result['results']:
+            xp_cooldowns.record(user_result.get('user_id'), 'message_xp', user_result)
+            entry = batch.get(str(user_result.get('user_id')))
+            if entry:
+                self._announce(entry, user_result)
+    
+    async def drain(self):
+        """Wait for a size-triggered flush still in flight, then flush the rest (shutdown)"""
+        if self._flush_task and not self._flush_task.done():
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+        await self.flush()
+    
+    async def _flush_per_message(self, batch):
+        """One message_xp request per counted message (the backend counts them),
+        MESSAGE_XP_CONCURRENCY users at a time"""
+        semaphore = asyncio.Semaphore(MESSAGE_XP_CONCURRENCY)
+        
+        async def send_user(user_id, entry):
+            async with semaphore:
+                for sent in range(entry['count']):
+                    if xp_cooldowns.remaining(user_id, 'message_xp'):
+                        # Rejected anyway, like send_xp_request() skips them
+                        xp_cooldowns.short_circuits += entry['count'] - sent
+                        return False
+                    data = {'user_id': user_id, 'username': entry['username'], 'action': 'message_xp'}
+                    status, result = await send_xp_payload_status(data)
+                    if status == 0 or status >= 500:
+                        # Backend trouble: keep the rest for the next flush
+                        self._merge(user_id, dict(entry, count=entry['count'] - sent))
+                        return True
+                    if status == 200 and isinstance(result, dict):
+                        xp_cooldowns.record(user_id, 'message_xp', result)
+                        self._announce(entry, result)
+                return False
+        
+        requeued = await asyncio.gather(*(send_user(user_id, entry) for user_id, entry in batch.items()))
+        if any(requeued):
+            self._retry_at = time.monotonic() + self.retry_delay
+            print(f"❌ Message XP flush failed, {sum(requeued)} users re-queued")
+    
+    @staticmethod
+    def _announce(entry, result):
+        if result.get('success') and result.get('level_up'):
+            announcement_buffer.announce(entry['channel'], f"🎉 **{entry['username']}** {result['message']}")
+    
+    def _merge(self, user_id, entry):
+        current = self.pending.get(user_id)
+        if current is None:
+            self.pending[user_id] = entry
+        else:
+            current['count'] += entry['count']
+        self.pending_messages += entry['count']
+
+message_xp_buffer = MessageXPBuffer(MESSAGE_XP_FLUSH_SIZE, MESSAGE_XP_FLUSH_INTERVAL)
+
+@supervisor.every('message_xp_flush', MESSAGE_XP_FLUSH_INTERVAL)
+async def message_xp_flush_loop():
+    """Job that flushes buffered message XP"""
+    await message_xp_buffer.flush()
+
+async def process_message_xp(user_id, username, channel):
+    """Count a message for XP (il backend da XP ogni 10 messaggi)"""
+    message_xp_buffer.add(user_id, username, channel)
 
 async def process_presence_xp(user_id, username):
     """Process XP from presence (ogni 15 minuti)"""
     return await send_xp_request('presence_xp', user_id, username)
 
+@router.exact('!xp force')
 async def force_presence_xp(message):
     """Force presence XP for testing"""
     user_id = str(message.author.id)
@@ -631,39 +2226,47 @@ async def force_presence_xp(message):
 
 async def send_xp_request(action, user_id, username):
     """Send XP request to API"""
+    remaining = xp_cooldowns.remaining(user_id, action)
+    if remaining:
+        xp_cooldowns.short_circuits += 1
+        return cooldown_result(remaining)
+    
     data = {
         'user_id': user_id,
         'username': username,
         'action': action
     }
     
-    headers = {
-        'Content-Type': 'application/json',
-        'User-Agent': 'Mozilla/5.0 (compatible; TesseadeBot/1.0)',
-    }
-    
+    result = await send_xp_payload(data)
+    xp_cooldowns.record(user_id, action, result)
+    return result
+
+async def send_xp_payload(data):
+    """POST a raw payload to xp-handler.php"""
+    status, result = await send_xp_payload_status(data)
+    return result if status == 200 else None
+
+async def send_xp_payload_status(data):
+    """send_xp_payload() that also returns the HTTP status (0: not sent / no answer)"""
     try:
-        xp_url = PHP_API_URL.replace('discord.php', 'xp-handler.php')
+        status, result = await api_client.request('xp', data)
         
-        response = requests.post(
-            xp_url,
-            json=data,
-            headers=headers,
-            timeout=10
-        )
-        
-        if response.status_code == 200:
-            return response.json()
-        else:
-            print(f"❌ XP API Error {response.status_code}")
-            return None
+        if status != 200:
+            print(f"❌ XP API Error {status}")
+        return status, result
             
     except Exception as e:
         print(f"❌ XP Request Error: {e}")
-        return None
+        return 0, None
+
+def is_unknown_action(result) -> bool:
+    """xp-handler.php reply for an action it doesn't implement"""
+    return (isinstance(result, dict) and not result.get('success')
+            and 'unknown action' in str(result.get('error', '')).lower())
 
 # === COMMAND HANDLERS ===
 
+@router.prefix('!xp')
 async def handle_xp_command(message):
     """Handle !xp commands"""
     parts = message.content.split()
@@ -677,6 +2280,16 @@ async def handle_xp_command(message):
         await send_to_api(data, message.channel, 'xp_stats')
         
     elif parts[1] == 'cooldown':
+        # Answer locally when every XP cooldown is known
+        remaining = [xp_cooldowns.remaining(str(message.author.id), action) for action in XP_COOLDOWN_ACTIONS]
+        if all(remaining):
+            response = "⏱️ **XP cooldowns**\n"
+            for label, seconds in zip(XP_COOLDOWN_ACTIONS.values(), remaining):
+                seconds = int(seconds)
+                response += f"{label}: {seconds // 60}m {seconds % 60}s remaining\n"
+            await message.channel.send(response)
+            return
+        
         data = {
             'user_id': str(message.author.id),
             'username': message.author.display_name,
@@ -684,6 +2297,7 @@ async def handle_xp_command(message):
         }
         await send_to_api(data, message.channel, 'xp_cooldown')
 
+@router.exact('!leaderboard')
 async def handle_leaderboard_command(message):
     """Handle !leaderboard command"""
     data = {
@@ -696,22 +2310,24 @@ async def handle_leaderboard_command(message):
 
 async def send_to_api(data, channel, request_type):
     """Send request to PHP API"""
-    headers = {
-        'Content-Type': 'application/json',
-        'User-Agent': 'Mozilla/5.0 (compatible; TesseadeBot/1.0)',
-    }
-    
     try:
         if request_type in ['xp_stats', 'xp_cooldown', 'leaderboard']:
-            url = PHP_API_URL.replace('discord.php', 'xp-handler.php')
+            kind = 'xp_query'
         else:
-            url = PHP_API_URL
+            kind = 'command'
         
-        response = requests.post(url, json=data, headers=headers, timeout=15)
+        ttl = RESPONSE_CACHE_TTLS.get(data.get('action'))
+        if ttl:
+            result = await response_cache.get(
+                response_cache_key(data, channel),
+                lambda: fetch_api_result(kind, data),
+                ttl,
+                keep=lambda result: bool(result.get('response'))  # not errors
+            )
+        else:
+            result = await fetch_api_result(kind, data)
         
-        if response.status_code == 200:
-            result = response.json()
-            
+        if result is not None:
             if result.get('response'):
                 await channel.send(result['response'])
                 return result
@@ -726,5 +2342,747 @@ async def send_to_api(data, channel, request_type):
         
     return None
 
+async def fetch_api_result(kind, data):
+    """POST to the API, returns the JSON result or None on a non-200 status"""
+    status, result = await api_client.request(kind, data)
+    return result if status == 200 else None
+
+# Read-only responses; leaderboard is global, the rest per user
+response_cache = TTLCache(ttl=60, max_size=10000)
+
+def response_cache_key(data, channel):
+    action = data['action']
+    if action == 'leaderboard':
+        return action, None  # the request carries no guild, every guild gets the same board
+    return action, data['user_id']
+
+@router.fallback
+async def handle_game_command(message):
+    """Pass any other command through to discord.php"""
+    user_id = str(message.author.id)
+    data = {
+        'user_id': user_id,
+        'username': message.author.display_name,
+        'command': message.content
+    }
+    
+    await send_to_api(data, message.channel, 'command')
+    
+    # *** NICKNAME UPDATE TRIGGERS ***
+    # Update nickname when character elements change
+    if message.content.startswith(NICKNAME_TRIGGERS):
+        print(f"🎨 Nickname update triggered by: {message.content}")
+        character_cache.invalidate(user_id)
+        response_cache.invalidate(('get_stats', user_id))
+        # Debounced: chained !join/!choose commands end up as one update
+        if message.guild:  # no nickname to update in DMs
+            nickname_reconciler.schedule(message.author, message.channel)
+
+def is_bot_owner(message) -> bool:
+    """Guild owner or one of BOT_OWNER_IDS"""
+    guild_owner_id = message.guild.owner_id if message.guild else None  # None in DMs
+    return message.author.id == guild_owner_id or message.author.id in BOT_OWNER_IDS
+
+async def require_owner(message) -> bool:
+    """is_bot_owner(), telling the author off when not"""
+    if is_bot_owner(message):
+        return True
+    await message.channel.send("❌ Owner only")
+    return False
+
+@router.exact('!debug commands')
+async def debug_commands(message):
+    """Show per-command counts and latency (owner only)"""
+    if not await require_owner(message):
+        return
+    
+    response = "📊 **Command latency**\n```\n"
+    response += f"{'command':<20}{'count':>7}{'avg':>8}{'p50':>7}{'p99':>7}\n"
+    
+    ranked = sorted(router.stats.items(), key=lambda item: item[1].total, reverse=True)
+    for label, histogram in ranked[:20]:
+        avg = histogram.total / histogram.count
+        response += (
+            f"{label[:19]:<20}{histogram.count:>7}{avg:>7.2f}s"
+            f"{histogram.quantile(0.5):>6g}s{histogram.quantile(0.99):>6g}s\n"
+        )
+    response += "```"
+    
+    await message.channel.send(response)
+
+@router.exact('!debug backend')
+async def debug_backend(message):
+    """Show backend queue depth, shed counts and circuit state (owner only)"""
+    if not await require_owner(message):
+        return
+    
+    stats = api_client.stats()
+    shed = ', '.join(f"{kind}: {count}" for kind, count in sorted(stats['shed'].items())) or 'none'
+    lanes = ', '.join(f"{lane}: {active} active/{waiting} waiting" for lane, (active, waiting) in stats['lanes'].items())
+    
+    await message.channel.send(
+        f"🔌 **Backend**\n"
+        f"Queue: {stats['depth']}/{stats['max_queue']} (background limit {stats['background_limit']})\n"
+        f"Lanes: {lanes}\n"
+        f"Circuit: {stats['breaker']} ({stats['failures']} consecutive failures)\n"
+        f"Shed: {shed}"
+    )
+
+@router.exact('!debug stalls')
+async def debug_stalls(message):
+    """Show the event-loop stalls caught by the watchdog (owner only)"""
+    if not await require_owner(message):
+        return
+    
+    if not stall_watchdog.running:
+        await message.channel.send("🐢 Stall watchdog is off (set STALL_WATCHDOG_THRESHOLD)")
+        return
+    
+    report = stall_watchdog.report(limit=5, stack_depth=6)
+    if len(report) > 1900:
+        report = report[:1900] + '\n...'
+    await message.channel.send(f"🐢 **Event-loop stalls**\n```\n{report}\n```")
+
+@router.exact('!debug duels')
+async def debug_duels(message):
+    """Show tracked duels and the soonest pending channel deletions (owner only)"""
+    if not await require_owner(message):
+        return
+    
+    now = time.time()
+    pending = deletion_scheduler.pending()
+    response = f"⚔️ **Duels**: {len(duel_channels)} tracked, {len(pending)} deletions pending\n"
+    for channel_id, deadline, phase in pending[:10]:
+        response += f"<#{channel_id}> in {max(0.0, deadline - now):.0f}s ({phase})\n"
+    
+    await message.channel.send(response)
+
+@router.exact('!debug tasks')
+async def debug_tasks(message):
+    """Show the supervised background jobs (owner only)"""
+    if not await require_owner(message):
+        return
+    
+    now = time.time()
+    response = "🔁 **Background jobs**\n```\n"
+    for job in supervisor.jobs.values():
+        if job.task is None or job.task.done():
+            state = 'stopped'
+        elif job.running:
+            state = 'running'
+        else:
+            state = f"next in {max(0.0, job.next_run - now):.0f}s"
+        response += f"{job.name:<18}{state:<16}runs {job.runs:<6}last {job.last_duration:.2f}s"
+        if job.failures:
+            response += f"  {job.failures} failures ({job.last_error[:80]})"
+        response += "\n"
+    response += "```"
+    
+    await message.channel.send(response)
+
+# === BACKEND HTTP CLIENT ===
+
+API_HEADERS = {
+    'Content-Type': 'application/json',
+    'User-Agent': 'Mozilla/5.0 (compatible; TesseadeBot/1.0)',
+}
+
+# request kind: (endpoint, timeout seconds)
+API_ROUTES = {
+    'command': ('discord', 15),
+    'duel': ('discord', 15),
+    'cleanup': ('discord', 10),
+    'xp': ('xp', 10),
+    'xp_query': ('xp', 15),
+    'character': ('xp', 10),
+}
+
+# request kind: priority lane (duel turns first, background accrual/polling last)
+API_LANES = {
+    'duel': 'duel',
+    'command': 'interactive',
+    'xp_query': 'interactive',
+    'xp': 'background',
+    'cleanup': 'background',
+    'character': 'background',
+}
+API_LANE_ORDER = ('duel', 'interactive', 'background')
+
+# Shed first when the backend is slow or failing
+API_BACKGROUND_KINDS = {kind for kind, lane in API_LANES.items() if lane == 'background'}
+
+class PriorityLimiter:
+    """Concurrency limit with per-lane budgets; freed slots go to the highest-priority lane"""
+    
+    def __init__(self, total: int, lane_limits: Dict[str, int]):
+        self.total = total
+        self.lane_limits = lane_limits
+        self.in_use = 0
+        self.active: Dict[str, int] = {lane: 0 for lane in API_LANE_ORDER}
+        self.waiters: Dict[str, deque] = {lane: deque() for lane in API_LANE_ORDER}
+    
+    def _can_run(self, lane: str) -> bool:
+        return self.in_use < self.total and self.active[lane] < self.lane_limits.get(lane, self.total)
+    
+    def _take(self, lane: str):
+        self.in_use += 1
+        self.active[lane] += 1
+    
+    async def acquire(self, lane: str):
+        if not self.waiters[lane] and self._can_run(lane):
+            self._take(lane)
+            return
+        
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters[lane].append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Slot was granted just before we got cancelled
+                self.release(lane)
+            else:
+                # release() may already have popped it while skipping cancelled waiters
+                with contextlib.suppress(ValueError):
+                    self.waiters[lane].remove(waiter)
+            raise
+    
+    def release(self, lane: str):
+        self.in_use -= 1
+        self.active[lane] -= 1
+        
+        for waiting_lane in API_LANE_ORDER:
+            queue = self.waiters[waiting_lane]
+            while queue and self._can_run(waiting_lane):
+                waiter = queue.popleft()
+                if not waiter.done():
+                    self._take(waiting_lane)
+                    waiter.set_result(None)
+    
+    @contextlib.asynccontextmanager
+    async def slot(self, lane: str):
+        await self.acquire(lane)
+        try:
+            yield
+        finally:
+            self.release(lane)
+
+class BackendOverloaded(Exception):
+    """Request shed without being sent (queue full or circuit open)"""
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures, half-opens after `cooldown` seconds"""
+    
+    def __init__(self, threshold: int = 5, cooldown: float = 30):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+    
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at < self.cooldown:
+            return 'open'
+        return 'half_open'
+    
+    def record_success(self):
+        if self.opened_at is not None:
+            print("✅ Backend circuit closed")
+        self.failures = 0
+        self.opened_at = None
+    
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.threshold:
+            if self.opened_at is None:
+                print(f"⚠️ Backend circuit opened after {self.failures} failures")
+            self.opened_at = time.monotonic()
+
+class BackendClient:
+    """Shared non-blocking client for discord.php / xp-handler.php"""
+    
+    def __init__(self, max_concurrency: int = 20, pool_size: int = 50, max_queue: int = 200,
+                 background_share: float = 0.5, breaker: Optional[CircuitBreaker] = None,
+                 lane_limits: Optional[Dict[str, int]] = None):
+        self.max_concurrency = max_concurrency
+        self.pool_size = pool_size
+        self.max_queue = max_queue
+        self.background_limit = int(max_queue * background_share)
+        self.breaker = breaker or CircuitBreaker()
+        self.limiter = PriorityLimiter(max_concurrency, lane_limits or {})
+        self.depth = 0  # queued + in flight
+        self.shed: Dict[str, int] = {}  # kind: requests shed
+        self.latency: Dict[Tuple[str, str], LatencyHistogram] = {}  # (endpoint, action)
+        self.responses: Dict[Tuple[str, str], int] = {}  # (endpoint, status code / error): count
+        self._session: Optional[aiohttp.ClientSession] = None
+    
+    def endpoint_url(self, endpoint: str) -> Optional[str]:
+        return XP_API_URL if endpoint == 'xp' else PHP_API_URL
+    
+    def _get_session(self) -> aiohttp.ClientSession:
+        # Created lazily so it binds to the running event loop
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(connector=connector, headers=API_HEADERS)
+        return self._session
+    
+    async def request(self, kind: str, data: dict):
+        """POST data for a request kind, returns (status, json or None).
+        
+        Raises BackendOverloaded when the request is shed.
+        """
+        endpoint, timeout = API_ROUTES[kind]
+        session = self._get_session()
+        
+        background = kind in API_BACKGROUND_KINDS
+        if background and self.breaker.state == 'open':
+            self._shed(kind)
+            raise BackendOverloaded('backend circuit open')
+        if self.depth >= (self.background_limit if background else self.max_queue):
+            self._shed(kind)
+            raise BackendOverloaded('backend request queue full')
+        
+        self.depth += 1
+        try:
+            async with self.limiter.slot(API_LANES[kind]):
+                started = time.perf_counter()
+                outcome = 'error'
+                try:
+                    async with session.post(
+                        self.endpoint_url(endpoint),
+                        json=data,
+                        timeout=aiohttp.ClientTimeout(total=timeout)
+                    ) as response:
+                        outcome = str(response.status)
+                        if response.status >= 500:
+                            self.breaker.record_failure()
+                        else:
+                            self.breaker.record_success()
+                        
+                        if response.status != 200:
+                            return response.status, None
+                        # PHP does not always send a JSON content type
+                        return response.status, await response.json(content_type=None)
+                
+                except asyncio.TimeoutError:
+                    outcome = 'timeout'
+                    self.breaker.record_failure()
+                    raise
+                except aiohttp.ClientError:
+                    self.breaker.record_failure()
+                    raise
+                finally:
+                    self._observe(endpoint, data, outcome, time.perf_counter() - started)
+        finally:
+            self.depth -= 1
+    
+    MAX_ACTION_LABELS = 100
+    
+    def _observe(self, endpoint: str, data: dict, outcome: str, seconds: float):
+        action = data.get('action')
+        if not action:
+            # discord.php commands: '!duel attack', '!system cleanup_duels', '!join', ...
+            words = str(data.get('command', '')).split()
+            action = ' '.join(words[:2]) if words[:1] in (['!duel'], ['!system']) else (words[0] if words else '')
+        
+        key = (endpoint, action)
+        histogram = self.latency.get(key)
+        if histogram is None:
+            if len(self.latency) >= self.MAX_ACTION_LABELS:
+                key = (endpoint, 'other')
+                histogram = self.latency.get(key)
+            if histogram is None:
+                histogram = self.latency[key] = LatencyHistogram()
+        histogram.observe(seconds)
+        
+        key = (endpoint, outcome)
+        self.responses[key] = self.responses.get(key, 0) + 1
+    
+    def _shed(self, kind: str):
+        self.shed[kind] = self.shed.get(kind, 0) + 1
+    
+    def stats(self) -> dict:
+        return {
+            'depth': self.depth,
+            'max_queue': self.max_queue,
+            'background_limit': self.background_limit,
+            'shed': dict(self.shed),
+            'lanes': {
+                lane: (self.limiter.active[lane], len(self.limiter.waiters[lane]))
+                for lane in API_LANE_ORDER
+            },
+            'breaker': self.breaker.state,
+            'failures': self.breaker.failures,
+        }
+    
+    async def close(self):
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+api_client = BackendClient(
+    API_MAX_CONCURRENCY,
+    API_POOL_SIZE,
+    API_MAX_QUEUE,
+    API_BACKGROUND_QUEUE_SHARE,
+    CircuitBreaker(API_BREAKER_THRESHOLD, API_BREAKER_COOLDOWN),
+    {'interactive': API_INTERACTIVE_CONCURRENCY, 'background': API_BACKGROUND_CONCURRENCY}
+)
+
+# === STALL WATCHDOG ===
+
+class StallSite:
+    __slots__ = ('count', 'total', 'worst', 'stack')
+    
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.worst = 0.0
+        self.stack: List[traceback.FrameSummary] = []
+
+class StallWatchdog:
+    """Thread that notices when the event loop stops running callbacks.
+    
+    The loop re-arms a heartbeat every `interval`; if the heartbeat is more than
+    `threshold` late the thread grabs the loop thread's stack from
+    sys._current_frames(). When the heartbeat comes back the whole stall is
+    charged to the call site it caught: the innermost frame in bot.py.
+    """
+    
+    MAX_SITES = 200
+    
+    def __init__(self, threshold: float, report_path: Optional[str] = None):
+        self.threshold = threshold
+        self.interval = max(0.05, threshold / 4)
+        self.report_path = report_path
+        self.sites: Dict[str, StallSite] = {}
+        self.stalls = 0
+        self.last_beat = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id = 0
+        self._beat_handle: Optional[asyncio.TimerHandle] = None
+        self._stalled: Optional[Tuple[float, List[traceback.FrameSummary]]] = None  # (beat, stack)
+    
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+    
+    def start(self, loop: asyncio.AbstractEventLoop):
+        if self.running:
+            return
+        self._loop = loop
+        self._loop_thread_id = threading.get_ident()
+        self._stop.clear()
+        self._beat()
+        self._thread = threading.Thread(target=self._watch, name='stall-watchdog', daemon=True)
+        self._thread.start()
+        print(f"🐢 Stall watchdog on (threshold {self.threshold:g}s)")
+    
+    def stop(self):
+        self._stop.set()
+        if self._beat_handle:
+            self._beat_handle.cancel()
+            self._beat_handle = None
+        if self._thread:
+            self._thread.join(timeout=1)
+            self._thread = None
+    
+    def _beat(self):
+        self.last_beat = time.monotonic()
+        self._beat_handle = self._loop.call_later(self.interval, self._beat)
+    
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            beat = self.last_beat
+            if self._stalled:
+                stalled_beat, stack = self._stalled
+                if beat != stalled_beat:
+                    # The loop is back: the stall lasted until this heartbeat ran
+                    self._stalled = None
+                    self._record(beat - stalled_beat - self.interval, stack)
+            elif time.monotonic() - beat - self.interval > self.threshold:
+                frame = sys._current_frames().get(self._loop_thread_id)
+                if frame is not None:
+                    self._stalled = (beat, traceback.extract_stack(frame))
+                    del frame
+    
+    @staticmethod
+    def call_site(stack: List[traceback.FrameSummary]) -> str:
+        here = os.path.abspath(__file__)
+        for frame in reversed(stack):
+            if os.path.abspath(frame.filename) == here:
+                return f"{frame.name} (bot.py:{frame.lineno})"
+        frame = stack[-1]
+        return f"{frame.name} ({os.path.basename(frame.filename)}:{frame.lineno})"
+    
+    def _record(self, duration: float, stack: List[traceback.FrameSummary]):
+        site_key = self.call_site(stack) if stack else 'unknown'
+        with self._lock:
+            self.stalls += 1
+            site = self.sites.get(site_key)
+            if site is None:
+                if len(self.sites) >= self.MAX_SITES:
+                    site_key = 'other'
+                    site = self.sites.get(site_key)
+                if site is None:
+                    site = self.sites[site_key] = StallSite()
+            site.count += 1
+            site.total += duration
+            if duration >= site.worst:
+                site.worst = duration
+                site.stack = stack
+        
+        print(f"🐢 Event loop stalled {duration:.2f}s in {site_key}")
+        if self.report_path:
+            try:
+                tmp_path = f"{self.report_path}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.write(self.report())
+                os.replace(tmp_path, self.report_path)
+            except OSError as e:
+                print(f"❌ Error writing stall report: {e}")
+    
+    def report(self, limit: int = 20, stack_depth: int = 25) -> str:
+        """Worst call sites by total stalled time, with the stack of the longest stall"""
+        with self._lock:
+            ranked = sorted(self.sites.items(), key=lambda item: item[1].total, reverse=True)[:limit]
+            stalls = self.stalls
+        if not ranked:
+            return f"No stalls over {self.threshold:g}s"
+        
+        lines = [f"{stalls} stalls over {self.threshold:g}s"]
+        for site_key, site in ranked:
+            lines.append('')
+            lines.append(f"{site_key}: {site.count}x, {site.total:.2f}s total, worst {site.worst:.2f}s")
+            lines.extend(line.rstrip() for line in traceback.format_list(site.stack[-stack_depth:]))
+        return '\n'.join(lines)
+
+stall_watchdog = StallWatchdog(STALL_WATCHDOG_THRESHOLD, STALL_REPORT_PATH)
+
+# === METRICS ===
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes a periodic sleep"""
+    
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self.histogram = LatencyHistogram()
+        self.last = 0.0
+        self.max = 0.0
+        self._task: Optional[asyncio.Task] = None
+    
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+    
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            self.last = max(0.0, loop.time() - started - self.interval)
+            self.max = max(self.max, self.last)
+            self.histogram.observe(self.last)
+
+loop_lag_monitor = LoopLagMonitor()
+
+def _label_value(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(labels: Dict[str, object]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_label_value(value)}"' for name, value in labels.items()) + '}'
+
+class MetricsWriter:
+    """Builds a Prometheus text exposition"""
+    
+    def __init__(self):
+        self.lines: List[str] = []
+        self._declared: Set[str] = set()
+    
+    def _declare(self, name: str, kind: str, help_text: str):
+        if name not in self._declared:
+            self._declared.add(name)
+            self.lines.append(f'# HELP {name} {help_text}')
+            self.lines.append(f'# TYPE {name} {kind}')
+    
+    def gauge(self, name: str, help_text: str, value, **labels):
+        self._declare(name, 'gauge', help_text)
+        self.lines.append(f'{name}{_labels(labels)} {value}')
+    
+    def counter(self, name: str, help_text: str, value, **labels):
+        self._declare(name, 'counter', help_text)
+        self.lines.append(f'{name}{_labels(labels)} {value}')
+    
+    def histogram(self, name: str, help_text: str, histogram: LatencyHistogram, **labels):
+        self._declare(name, 'histogram', help_text)
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), histogram.counts):
+            cumulative += count
+            self.lines.append(f'{name}_bucket{_labels({**labels, "le": bound})} {cumulative}')
+        self.lines.append(f'{name}_sum{_labels(labels)} {histogram.total}')
+        self.lines.append(f'{name}_count{_labels(labels)} {histogram.count}')
+    
+    def render(self) -> str:
+        return '\n'.join(self.lines) + '\n'
+
+def render_metrics() -> str:
+    metrics = MetricsWriter()
+    
+    # Backend
+    for (endpoint, action), histogram in sorted(api_client.latency.items()):
+        metrics.histogram('tesseade_backend_request_seconds', 'PHP backend request latency',
+                          histogram, endpoint=endpoint, action=action)
+    for (endpoint, outcome), count in sorted(api_client.responses.items()):
+        metrics.counter('tesseade_backend_responses_total', 'PHP backend responses by status code or error',
+                        count, endpoint=endpoint, status=outcome)
+    for kind, count in sorted(api_client.shed.items()):
+        metrics.counter('tesseade_backend_shed_total', 'Backend requests shed without being sent', count, kind=kind)
+    metrics.gauge('tesseade_backend_queue_depth', 'Backend requests queued or in flight', api_client.depth)
+    for lane, active in api_client.limiter.active.items():
+        metrics.gauge('tesseade_backend_lane_active', 'Backend requests in flight per priority lane', active, lane=lane)
+    for lane, waiters in api_client.limiter.waiters.items():
+        metrics.gauge('tesseade_backend_lane_waiting', 'Backend requests waiting per priority lane', len(waiters), lane=lane)
+    metrics.gauge('tesseade_backend_circuit_open', 'Backend circuit breaker open (1) or closed/half-open (0)',
+                  int(api_client.breaker.state == 'open'))
+    
+    # Commands
+    for label, histogram in sorted(router.stats.items()):
+        metrics.histogram('tesseade_command_seconds', 'Command handler latency', histogram, command=label)
+    
+    # Bot state
+    metrics.gauge('tesseade_user_activity_size', 'Users tracked for presence XP', len(user_activity))
+    metrics.counter('tesseade_presence_events_total', 'Presence events received', user_activity.presence_events)
+    metrics.counter('tesseade_presence_events_coalesced_total', 'Presence events dropped by coalescing',
+                    user_activity.presence_dropped)
+    metrics.gauge('tesseade_duel_channels', 'Tracked duel channels', len(duel_channels))
+    metrics.gauge('tesseade_duel_deletions_pending', 'Duel channels waiting for their deletion deadline',
+                  len(deletion_scheduler))
+    metrics.counter('tesseade_duel_deletions_total', 'Duel channels deleted at their deadline', deletion_scheduler.deleted)
+    for result, count in (('handled', duel_event_server.handled),
+                          ('ignored', duel_event_server.received - duel_event_server.handled),
+                          ('rejected', duel_event_server.rejected)):
+        metrics.counter('tesseade_duel_events_total', 'Pushed duel events by result', count, result=result)
+    metrics.histogram('tesseade_presence_tick_seconds', 'Presence XP tick duration', presence_tick_seconds)
+    metrics.gauge('tesseade_message_xp_pending', 'Messages buffered for the next message XP flush',
+                  message_xp_buffer.pending_messages)
+    metrics.gauge('tesseade_nickname_pending', 'Nickname updates waiting to run', nickname_reconciler.pending_count())
+    metrics.counter('tesseade_announcement_sends_saved_total', 'Level-up sends saved by merging',
+                    announcement_buffer.sends_saved)
+    metrics.counter('tesseade_xp_cooldown_short_circuits_total', 'XP requests skipped by the local cooldown mirror',
+                    xp_cooldowns.short_circuits)
+    caches = {'character': character_cache.stats(), 'response': response_cache.stats()}
+    for name, stats in caches.items():
+        metrics.gauge('tesseade_cache_entries', 'Cache entries', stats['size'], cache=name)
+    for name, stats in caches.items():
+        for result in ('hits', 'misses', 'shared'):
+            metrics.counter('tesseade_cache_lookups_total', 'Cache lookups by result', stats[result],
+                            cache=name, result=result)
+    
+    # Event loop
+    metrics.gauge('tesseade_pending_tasks', 'asyncio tasks not yet done', len(asyncio.all_tasks()))
+    metrics.histogram('tesseade_event_loop_lag_seconds', 'Event loop wake-up lag', loop_lag_monitor.histogram)
+    metrics.gauge('tesseade_event_loop_lag_max_seconds', 'Worst event loop lag since start', loop_lag_monitor.max)
+    metrics.counter('tesseade_event_loop_stalls_total', 'Event loop stalls caught by the watchdog', stall_watchdog.stalls)
+    metrics.gauge('tesseade_discord_latency_seconds', 'Discord gateway heartbeat latency',
+                  bot.latency if bot.latency == bot.latency and bot.latency != float('inf') else 0)
+    
+    return metrics.render()
+
+class MetricsServer:
+    """Serves render_metrics() on /metrics"""
+    
+    def __init__(self):
+        self._runner: Optional[aiohttp.web.AppRunner] = None
+    
+    async def start(self, host: str, port: int):
+        app = aiohttp.web.Application()
+        app.router.add_get('/metrics', self.handle)
+        self._runner = aiohttp.web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await aiohttp.web.TCPSite(self._runner, host, port).start()
+        print(f"📈 Metrics at http://{host}:{port}/metrics")
+    
+    async def handle(self, request):
+        return aiohttp.web.Response(text=render_metrics(), content_type='text/plain', charset='utf-8')
+    
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+metrics_server = MetricsServer()
+
+# === SHARDED WORKERS ===
+
+def shard_ranges(shard_count: int, processes: int) -> List[List[int]]:
+    """Split shards 0..shard_count-1 into `processes` contiguous ranges"""
+    processes = max(1, min(processes, shard_count))
+    return [
+        list(range(index * shard_count // processes, (index + 1) * shard_count // processes))
+        for index in range(processes)
+    ]
+
+def run_shard_workers(processes: int):
+    """Run one `python bot.py` per shard range and restart the ones that die"""
+    if not SHARD_COUNT:
+        raise SystemExit("❌ SHARD_PROCESSES > 1 needs a numeric SHARD_COUNT")
+    
+    ranges = shard_ranges(SHARD_COUNT, processes)
+    workers: Dict[int, subprocess.Popen] = {}
+    restart_at: Dict[int, float] = {}
+    stopping = False
+    
+    def spawn(index: int) -> subprocess.Popen:
+        env = dict(os.environ, SHARD_IDS=','.join(map(str, ranges[index])))
+        # One port / dump file per worker
+        if METRICS_PORT:
+            env['METRICS_PORT'] = str(METRICS_PORT + index)
+        if STALL_REPORT_PATH:
+            env['STALL_REPORT_PATH'] = f"{STALL_REPORT_PATH}.{index}"
+        print(f"🧩 Starting worker {index} for shards {ranges[index]}")
+        return subprocess.Popen([sys.executable, os.path.abspath(__file__)], env=env)
+    
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for worker in workers.values():
+            if worker.poll() is None:
+                worker.send_signal(signal.SIGINT)  # KeyboardInterrupt -> clean close()
+    
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    
+    for index in range(len(ranges)):
+        if stopping:
+            break
+        workers[index] = spawn(index)
+        # Stagger gateway identifies across workers
+        time.sleep(SHARD_START_DELAY)
+    
+    while workers:
+        time.sleep(1)
+        for index, worker in list(workers.items()):
+            code = worker.poll()
+            if code is None:
+                continue
+            if stopping:
+                del workers[index]
+            elif index not in restart_at:
+                print(f"❌ Worker {index} exited with code {code}, restarting in {SHARD_START_DELAY:g}s")
+                restart_at[index] = time.monotonic() + SHARD_START_DELAY
+            elif time.monotonic() >= restart_at[index]:
+                del restart_at[index]
+                workers[index] = spawn(index)
+
 if __name__ == "__main__":
-    bot.run(BOT_TOKEN)
+    if SHARD_PROCESSES > 1 and SHARD_IDS is None:
+        run_shard_workers(SHARD_PROCESSES)
+    else:
+        bot.run(BOT_TOKEN)